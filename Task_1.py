@@ -1,28 +1,41 @@
-import math
-import simpy
-import random
 import os
 import csv
-
-# Sets seed for reproducibility
-random.seed(10)
-
-def triangular_dist(minimum, mode, maximum):
+from random_streams import ReplicationStreams
+from variate_pool import bound_variates
+from running_statistics import PatientTimeStatistics
+from patient_records import PatientRecords
+from patient_stream import PatientStream
+from stage_times import STAGE_COLUMNS, stage_row, stage_breakdown
+from fast_engine import simulate
+from arrival_process import interarrival_times
+from simulation_profile import profiler_for
+from resource_usage import RESOURCE_NAMES, TrackedResource
+from raw_data_sink import check_header
+
+
+def stage_draws(streams):
     """
-    Wrapper for the random.triangular function.
+    Draw functions of the random variates of every stage, fetched once per replication so a
+    draw doesn't look up its distribution (pre-bound block iterators with pooled variates)
 
     Parameters:
-        minimum (float): lower bound of distribution
-        mode (float): midpoint of distribution
-        maximum (float): upper bound of distribution
-    
-    Returns: 
-        float: random value of given triangular distribution
-    """
-    return random.triangular(minimum, mode, maximum)
-
+        streams (ReplicationStreams): random number streams of the replication
 
-def get_cw_time(cw1, cw2, casualty_ward):
+    Returns:
+        dict: function without arguments that draws the next variate, by stage
+    """
+    return {
+        "patient_type": bound_variates(streams.patient_type, "choice", [1, 2, 3, 4], [35, 20, 5, 40]),
+        "cw_choice": bound_variates(streams.cw_choice, "random"),
+        "registration": bound_variates(streams.registration, "triangular", 0.2, 0.5, 1.0),
+        "cw1": bound_variates(streams.cw1, "triangular", 1.5, 3.2, 5.0),
+        "cw2": bound_variates(streams.cw2, "triangular", 2.8, 4.1, 6.3),
+        "x_ray": bound_variates(streams.x_ray, "triangular", 2.0, 2.8, 4.1),
+        "plaster": bound_variates(streams.plaster, "triangular", 3.0, 3.8, 4.7),
+    }
+
+
+def get_cw_time(cw1, cw2, casualty_ward, draws):
     """
     Gets the treatment time for casualty ward 1 or casualty ward 2 depending on the set casualty ward for the patient
 
@@ -30,32 +43,39 @@ def get_cw_time(cw1, cw2, casualty_ward):
         cw1 (Resource): resource for casualty ward 1
         cw2 (Resource): resource for casualty ward 2
         casualty_ward (Resource): set casualty ward for patient x
+        draws (dict): draw functions of the stages (stage_draws)
 
     Returns:
         float: treatment time for CW1/CW2 
     """
     if casualty_ward == cw1 :
-        return triangular_dist(1.5, 3.2, 5.0)
+        return draws["cw1"]()
     elif casualty_ward == cw2:
-        return triangular_dist(2.8, 4.1, 6.3)
+        return draws["cw2"]()
     else:
         return 0
 
 
-def patient(env, patient_id, patient_type, registration, cw1, cw2, x_ray, plaster, stats):
+def patient(env, patient_id, patient_type, registration, cw1, cw2, x_ray, plaster, stats, draws):
     """
     Simulates a patients process through the emergency room (Task 1)
     """
     arrival_time = env.now  # Record arrival time
+    stage_times = {}  # (wait, service) of every visited stage
 
     # Registration: R ->
     with registration.request() as req:
+        requested = env.now
         yield req
-        reg_time = triangular_dist(0.2, 0.5, 1.0)
+        reg_time = draws["registration"]()
+        stage_times["registration"] = (env.now - requested, reg_time)
         yield env.timeout(reg_time)
 
     # Allocation to CW1 or CW2: -> CW ->
-    casualty_ward = cw1 if random.random() < 0.6 else cw2
+    casualty_ward = cw1 if draws["cw_choice"]() < 0.6 else cw2
+
+    # The wait for the doctors counts as waiting in the casualty ward
+    requested = env.now
 
     # Wait until doctors arrive
     if env.now < 30:
@@ -64,44 +84,59 @@ def patient(env, patient_id, patient_type, registration, cw1, cw2, x_ray, plaste
     # Doctors handle patients in CW1/CW2
     with casualty_ward.request() as req:
         yield req
-        cw_time = get_cw_time(cw1, cw2, casualty_ward)
+        cw_time = get_cw_time(cw1, cw2, casualty_ward, draws)
+        stage_times["cw"] = (env.now - requested, cw_time)
         yield env.timeout(cw_time)
 
     # Type 1: Xray -> CW -> Exit
     if patient_type == 1: 
         with x_ray.request() as req:
+            requested = env.now
             yield req
-            x_time = triangular_dist(2.0, 2.8, 4.1)
+            x_time = draws["x_ray"]()
+            stage_times["x_ray"] = (env.now - requested, x_time)
             yield env.timeout(x_time)
         with casualty_ward.request() as req:
+            requested = env.now
             yield req
-            cw_time = get_cw_time(cw1, cw2, casualty_ward)
+            cw_time = get_cw_time(cw1, cw2, casualty_ward, draws)
+            stage_times["cw_2"] = (env.now - requested, cw_time)
             yield env.timeout(cw_time)
     
     # Type 2: -> Plaster -> Exit
     elif patient_type == 2:
         with plaster.request() as req:
+            requested = env.now
             yield req
-            plaster_time = triangular_dist(3.0, 3.8, 4.7)
+            plaster_time = draws["plaster"]()
+            stage_times["plaster"] = (env.now - requested, plaster_time)
             yield env.timeout(plaster_time)
     
     # Type 3: -> Xray -> Plaster -> Xray -> CW -> Exit
     elif patient_type == 3:
         with x_ray.request() as req:
+            requested = env.now
             yield req
-            x_time = triangular_dist(2.0, 2.8, 4.1)
+            x_time = draws["x_ray"]()
+            stage_times["x_ray"] = (env.now - requested, x_time)
             yield env.timeout(x_time)
         with plaster.request() as req:
+            requested = env.now
             yield req
-            plaster_time = triangular_dist(3.0, 3.8, 4.7)
+            plaster_time = draws["plaster"]()
+            stage_times["plaster"] = (env.now - requested, plaster_time)
             yield env.timeout(plaster_time)
         with x_ray.request() as req:
+            requested = env.now
             yield req
-            x_time = triangular_dist(2.0, 2.8, 4.1)
+            x_time = draws["x_ray"]()
+            stage_times["x_ray_2"] = (env.now - requested, x_time)
             yield env.timeout(x_time)
         with casualty_ward.request() as req:
+            requested = env.now
             yield req
-            cw_time = get_cw_time(cw1, cw2, casualty_ward)
+            cw_time = get_cw_time(cw1, cw2, casualty_ward, draws)
+            stage_times["cw_2"] = (env.now - requested, cw_time)
             yield env.timeout(cw_time)
     
     # Type 4: -> Exit
@@ -112,48 +147,108 @@ def patient(env, patient_id, patient_type, registration, cw1, cw2, x_ray, plaste
     departure_time = env.now
     total_time = departure_time - arrival_time
 
-    # Save time in statistics dictionary
-    stats["patients"].append({"id": patient_id, "type": patient_type, "total_time": total_time})
+    # Update the running statistics, the patient record is only kept if wanted
+    stats["times"].add(patient_type, total_time)
+    if stats["patients"] is not None:
+        stats["patients"].append(patient_id, patient_type, arrival_time, departure_time)
+    if stats["stages"] is not None:
+        stats["stages"].append(patient_id, patient_type, *stage_row(stage_times))
 
 
-def generate_patients(env, num_patients, registration, cw1, cw2, x_ray, plaster, stats):
+def generate_patients(env, num_patients, registration, cw1, cw2, x_ray, plaster, stats, streams, arrivals=None):
     """
     Generates patients arriving at the emergency department
     """
+    gaps = interarrival_times(streams.arrival, arrivals)
+    draws = stage_draws(streams)
     for i in range(num_patients):
-        interarrival_time = random.expovariate(1 / 0.3)
+        interarrival_time = next(gaps)
         yield env.timeout(interarrival_time)
-        patient_type = random.choices([1, 2, 3, 4], weights=[35, 20, 5, 40], k=1)[0]
-        env.process(patient(env, i, patient_type, registration, cw1, cw2, x_ray, plaster, stats))
+        patient_type = draws["patient_type"]()
+        env.process(patient(env, i, patient_type, registration, cw1, cw2, x_ray, plaster, stats, draws))
 
 
-def run_simulation(num_patients=250):
+def run_simulation(num_patients=250, seed=10, replication=0, common_random_numbers=False, pooled_variates=False,
+                   keep_patients=True, stream=None, arrivals=None, profile=False, engine="simpy", save=True):
     """
     Runs emergency room simulation
 
     Paramters:
         num_patients (int): Number of patients for simulation
+        seed (int): Root seed of the experiment
+        replication (int): Index of the replication, selects its own random number stream
+        common_random_numbers (bool): Use dedicated streams for arrivals, patient types, CW choice and
+            each service step, so all variants see the same patients for the same replication
+        pooled_variates (bool): Draw the random variates in vectorized NumPy blocks
+        keep_patients (bool): Keep a record of every patient, the statistics don't need it. Ignored with a stream
+        stream (str, optional): Path to a raw data file (.npy or .csv) the departures are streamed to in
+            chunks instead of kept in memory, with a summary file next to it
+        arrivals (NHPPArrivals, optional): Non-homogeneous arrivals from a rate table (hour of day and weekday
+            patterns), constant rate of 1/0.3 patients per minute if not given
+        profile (bool or SimulationProfiler): Measure events, wall times and peak memory of the run,
+            stored in results["profile"]
+        engine (str): "simpy" for the SimPy model, "fast" for the heap based engine without SimPy
+        save (bool): Save the statistics in the results directory
+
+    Returns:
+        tuple: calculated statistics and patient data of the run
     """
-    env = simpy.Environment()
+    profiler = profiler_for(profile)
+    profiler.start()
 
-    # Defines resources
-    registration = simpy.Resource(env, capacity=1)
-    cw1 = simpy.Resource(env, capacity=2)
-    cw2 = simpy.Resource(env, capacity=2)
-    x_ray = simpy.Resource(env, capacity=2)
-    plaster = simpy.Resource(env, capacity=1)
+    streams = ReplicationStreams(seed, replication, common_random_numbers, pooled_variates)
 
-    # Statistics dictionary
-    stats = {"patients": []}
+    # Statistics dictionary, with a stream no records are kept in memory (the stages neither)
+    records = keep_patients and stream is None
+    stats = {"patients": PatientRecords(num_patients) if records else None, "times": PatientTimeStatistics(),
+             "stages": PatientRecords(num_patients, STAGE_COLUMNS) if records else None}
 
-    env.process(generate_patients(env, num_patients, registration, cw1, cw2, x_ray, plaster, stats))
+    # Departures are streamed to disk in chunks instead of kept in memory
+    if stream is not None:
+        stats["patients"] = PatientStream(stream)
 
-    # Starts simulation
-    env.run()
+    if engine == "fast":
+        # Same model on the heap based engine without SimPy
+        with profiler.section("simulation"):
+            events = simulate(num_patients, streams, stats, arrivals=arrivals)
+        profiler.count(events, stats["resources"][RESOURCE_NAMES[0]].end_time)
+    else:
+        env = profiler.environment()
+
+        # Defines resources
+        registration = TrackedResource(env, capacity=1)
+        cw1 = TrackedResource(env, capacity=2)
+        cw2 = TrackedResource(env, capacity=2)
+        x_ray = TrackedResource(env, capacity=2)
+        plaster = TrackedResource(env, capacity=1)
+
+        env.process(generate_patients(env, num_patients, registration, cw1, cw2, x_ray, plaster, stats, streams, arrivals))
+
+        # Starts simulation
+        with profiler.section("simulation"):
+            env.run()
+
+        # Busy time of the resources, accumulated on every request and release
+        stats["resources"] = {}
+        for name, resource in zip(RESOURCE_NAMES, (registration, cw1, cw2, x_ray, plaster)):
+            resource.usage.end(env.now)
+            stats["resources"][name] = resource.usage
+
+    # The last chunk of the departures is written and the raw data file closed
+    if stream is not None:
+        stats["patients"].close()
 
     # Calculate statistics and save it in CSV
-    results = calc_statistics(stats)
-    save_statistics(results)
+    with profiler.section("calc_statistics"):
+        results = calc_statistics(stats)
+    if save:
+        with profiler.section("save"):
+            save_statistics(results)
+
+    if profile:
+        results["profile"] = profiler.record()
+
+    return results, stats
 
 
 def calc_statistics(stats):
@@ -161,44 +256,57 @@ def calc_statistics(stats):
     Calulates and displays statistics of the simulation
 
     Parameters:
-        stats (dict): Stats of each simulated patient
+        stats (dict): running statistics (and records) of the simulated patients
     
     Results:
         dict: A dictionary containing the calculated statistics
     """
-    total_patients = len(stats["patients"])
+    times = stats["times"]
+    total_patients = times.overall.count
     print(f"Total patients processed: {total_patients}")
 
-    # Group patients by type
-    types = {1: [], 2: [], 3: [], 4: []}
-    for patient in stats["patients"]:
-        types[patient["type"]].append(patient["total_time"])
-
     results = {"overall_avg_time": 0, "standard_deviation": 0, "types": {}}
 
-    for patient_type, times in types.items():
-        if times:
-            avg_time = sum(times) / len(times)
-            print(f"Type {patient_type}: {len(times)} patients, Avg. time = {avg_time:.2f} minutes")
-            results["types"][patient_type] = {"count": len(times), "avg_time": avg_time}
+    # Patients are grouped by type while the simulation runs
+    for patient_type, type_times in times.types.items():
+        if type_times.count:
+            print(f"Type {patient_type}: {type_times.count} patients, Avg. time = {type_times.mean:.2f} minutes")
+            results["types"][patient_type] = {"count": type_times.count, "avg_time": type_times.mean}
         else:
             print(f"Type {patient_type}: 0 patients")
-            results["types"][patient_type] = {"count": 0, "avg_time": 0}
+            results["types"][patient_type] = {"count": 0, "avg_time": 0.0}
 
     # Overall average time
-    all_times = [patient["total_time"] for patient in stats["patients"]]
-    overall_avg_time = sum(all_times) / total_patients
+    overall_avg_time = times.overall.mean
     print(f"Overall average treatment time: {overall_avg_time:.2f} minutes")
     results["overall_avg_time"] = overall_avg_time
 
     # Standard deviation
-    squared_differences = []
-    for patient in stats["patients"]:
-        squared_differences.append(math.pow(patient["total_time"] - overall_avg_time, 2))
-    standard_deviation = math.sqrt(sum(squared_differences) / (total_patients - 1))
+    standard_deviation = times.overall.standard_deviation
     print(f"Standard deviation of treatment time: {standard_deviation:.2f} minutes")
     results["standard_deviation"] = standard_deviation
 
+    # Utilization of the resources
+    results["utilization"] = {}
+    for name, usage in stats["resources"].items():
+        summary = usage.summary()
+        print(f"Utilization {name}: {summary['utilization']:.2%}, throughput = {summary['throughput']:.2f} per minute")
+        results["utilization"][name] = summary
+
+    # Quantiles of the time in the emergency room, if the departures were streamed
+    if isinstance(stats["patients"], PatientStream):
+        results["stream"] = stats["patients"].summary()
+        overall = results["stream"]["overall"]
+        print(f"Median treatment time = {overall['p50']:.2f}, 95th percentile = {overall['p95']:.2f} minutes")
+
+    # Waiting and service time per patient type and stage, if the stages were recorded
+    if stats.get("stages") is not None:
+        results["stages"] = stage_breakdown(stats["stages"])
+        for patient_type, stages in results["stages"].items():
+            for stage, times in stages.items():
+                print(f"Type {patient_type} {stage}: Avg. wait = {times['avg_wait']:.2f}, "
+                      f"Avg. service = {times['avg_service']:.2f} minutes")
+
     return results
 
 
@@ -215,9 +323,12 @@ def save_statistics(results, filename = "results/Task1.csv"):
         "Count Type 1", "Avg. Time Type 1",
         "Count Type 2", "Avg. Time Type 2",
         "Count Type 3", "Avg. Time Type 3",
-        "Count Type 4", "Avg. Time Type 4"
+        "Count Type 4", "Avg. Time Type 4",
+        "Utilization Registration", "Utilization CW1", "Utilization CW2", "Utilization X-Ray", "Utilization Plaster"
     ]
 
+    # Rows are only appended to a file with the same columns
+    check_header(filename, header)
     file_exists = os.path.exists(filename)
 
     with open(filename, "a" if file_exists else "w", newline="") as file:
@@ -235,7 +346,7 @@ def save_statistics(results, filename = "results/Task1.csv"):
             results["types"][2]["count"], f"{results['types'][2]['avg_time']:.2f}".replace(".", ","),
             results["types"][3]["count"], f"{results['types'][3]['avg_time']:.2f}".replace(".", ","),
             results["types"][4]["count"], f"{results['types'][4]['avg_time']:.2f}".replace(".", ",")
-        ]
+        ] + [f"{results['utilization'][name]['utilization']:.4f}".replace(".", ",") for name in RESOURCE_NAMES]
         writer.writerow(row)
 
 # Hauptprogramm
@@ -0,0 +1,115 @@
+import os
+import time
+import itertools
+import contextlib
+import statistics
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import Task_2
+from running_statistics import RunningStatistics
+
+"""
+    Sweep over the queue limit of casualty ward 2 (and the probability of the allocation to CW2)
+    of Task 2.
+
+    Every grid point runs its replications serially in one worker process, the grid points are
+    spread over a process pool. All grid points use the same replication streams (common random
+    numbers), so the differences between the rows come from the parameters and not from the
+    random numbers. The result is one table with a row per grid point.
+"""
+
+
+def run_grid_point(point, replications, seed, confidence, simulation_kwargs):
+    """
+    Runs all replications of one grid point
+
+    Parameters:
+        point (tuple): cw_limit and cw2_probability of the grid point
+        replications (int): Number of replications
+        seed (int): Root seed of the experiment
+        confidence (float): confidence level of the intervals
+        simulation_kwargs (dict): further keyword arguments for Task_2.run_simulation
+
+    Returns:
+        dict: row of the sweep table
+    """
+    cw_limit, cw2_probability = point
+    overall = RunningStatistics()
+    types = {patient_type: RunningStatistics() for patient_type in (1, 2, 3, 4)}
+
+    start = time.perf_counter()
+    # The statistics of every replication would be printed, which is just noise in a sweep
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for replication in range(replications):
+            results, stats = Task_2.run_simulation(cw_limit=cw_limit, cw2_probability=cw2_probability, seed=seed,
+                                                   replication=replication, common_random_numbers=True,
+                                                   keep_patients=False, save=False, **simulation_kwargs)
+            overall.add(results["overall_avg_time"])
+            for patient_type, type_statistics in types.items():
+                type_statistics.add(results["types"][patient_type]["avg_time"])
+    wall_time = time.perf_counter() - start
+
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+    half_width = z * overall.standard_deviation / replications ** 0.5
+    row = {
+        "CW2 Limit": cw_limit,
+        "CW2 Probability": cw2_probability,
+        "Replications": replications,
+        "Overall Average Time": overall.mean,
+        "CI Lower": overall.mean - half_width,
+        "CI Upper": overall.mean + half_width,
+    }
+    for patient_type, type_statistics in types.items():
+        type_half_width = z * type_statistics.standard_deviation / replications ** 0.5
+        row[f"Avg. Time Type {patient_type}"] = type_statistics.mean
+        row[f"CI Half-Width Type {patient_type}"] = type_half_width
+    row["Wall Time"] = wall_time
+    return row
+
+
+def run_sweep(cw_limits=range(0, 11), cw2_probabilities=(0.4,), replications=100, seed=10, confidence=0.95,
+              workers=None, filename="results/Task2_sweep.csv", **simulation_kwargs):
+    """
+    Runs the replications of every grid point on a process pool and writes the sweep table
+
+    Parameters:
+        cw_limits (iterable): queue limits of casualty ward 2
+        cw2_probabilities (iterable): probabilities of the allocation to casualty ward 2
+        replications (int): Number of replications per grid point
+        seed (int): Root seed of the experiment
+        confidence (float): confidence level of the intervals
+        workers (int, optional): Number of worker processes, defaults to the number of cores
+        filename (str, optional): Path to the csv file of the table, nothing is written if None
+        **simulation_kwargs: further keyword arguments for Task_2.run_simulation (e.g. num_patients, engine)
+
+    Returns:
+        DataFrame: one row per grid point with means, confidence intervals and wall time
+    """
+    grid = list(itertools.product(cw_limits, cw2_probabilities))
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(grid)))
+
+    task = partial(run_grid_point, replications=replications, seed=seed, confidence=confidence,
+                   simulation_kwargs=simulation_kwargs)
+
+    if workers == 1:
+        rows = [task(point) for point in grid]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            rows = list(executor.map(task, grid))
+
+    table = pd.DataFrame(rows)
+    if filename is not None:
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        table.to_csv(filename, sep=";", index=False)
+    return table
+
+
+# Hauptprogramm
+if __name__ == "__main__":
+    sweep = run_sweep()
+    print(sweep.to_string(index=False))
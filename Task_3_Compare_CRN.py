@@ -0,0 +1,100 @@
+import statistics
+import pandas as pd
+import Task_1
+import Task_3
+import Task_3v2
+import Task_3v3
+import Task_3v4
+from replication_runner import run_replications
+
+"""
+    Compares the priority versions of Task 3 with the version without priorities (Task 1)
+    using common random numbers (CRN).
+
+    With CRN every version is run with the same seed and dedicated random number streams,
+    so replication k of every version sees the same patients. The difference between two
+    versions is then calculated per replication (paired differences). To show how much noise
+    CRN removes, the same comparison is done with independent sampling (every version has its
+    own seed) and the variances of the differences are compared.
+"""
+
+# Versions to compare, the first one is the baseline
+VERSIONS = [
+    ("No Priority", Task_1.run_simulation),
+    ("Priority 2nd Time CW", Task_3.run_simulation),
+    ("Priority CW always", Task_3v2.run_simulation),
+    ("Priority by Arrival Time in CW", Task_3v3.run_simulation),
+    ("Priority 2nd Time CW conditional", Task_3v4.run_simulation),
+]
+
+
+def overall_avg_times(run_simulation, replications, seed, common_random_numbers, workers=None):
+    """
+    Runs the replications of one version and collects the overall average time of each
+
+    Parameters:
+        run_simulation (function): run_simulation function of the version
+        replications (int): Number of replications
+        seed (int): root seed of the replications
+        common_random_numbers (bool): use the dedicated random number streams
+        workers (int, optional): Number of worker processes
+
+    Returns:
+        list: overall average time of every replication
+    """
+    replication_results = run_replications(run_simulation, replications=replications, workers=workers,
+                                           root_seed=seed, common_random_numbers=common_random_numbers)
+    return [results["overall_avg_time"] for results, stats in replication_results]
+
+
+def compare_versions(versions=VERSIONS, replications=100, seed=10, confidence=0.95, workers=None):
+    """
+    Compares every version with the baseline by paired differences of the overall average time
+
+    Parameters:
+        versions (list): (name, run_simulation) of the versions, the first one is the baseline
+        replications (int): Number of replications per version
+        seed (int): root seed of the replications
+        confidence (float): confidence level of the interval of the mean difference
+        workers (int, optional): Number of worker processes
+
+    Returns:
+        DataFrame: mean difference to the baseline, its confidence interval and the variance
+            of the differences with CRN and with independent sampling
+    """
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+
+    crn_times = []
+    independent_times = []
+    for index, (name, run_simulation) in enumerate(versions):
+        crn_times.append(overall_avg_times(run_simulation, replications, seed, True, workers))
+        independent_times.append(overall_avg_times(run_simulation, replications, seed + index, False, workers))
+
+    rows = []
+    for index in range(1, len(versions)):
+        crn_differences = [v - b for v, b in zip(crn_times[index], crn_times[0])]
+        independent_differences = [v - b for v, b in zip(independent_times[index], independent_times[0])]
+
+        mean_difference = statistics.mean(crn_differences)
+        crn_variance = statistics.variance(crn_differences)
+        independent_variance = statistics.variance(independent_differences)
+        half_width = z * (crn_variance / replications) ** 0.5
+
+        rows.append({
+            "Version": versions[index][0],
+            "Mean Difference": mean_difference,
+            "CI Lower": mean_difference - half_width,
+            "CI Upper": mean_difference + half_width,
+            "Variance CRN": crn_variance,
+            "Variance Independent": independent_variance,
+            "Variance Reduction": 1 - crn_variance / independent_variance if independent_variance else 0,
+        })
+
+    return pd.DataFrame(rows).set_index("Version")
+
+
+# Hauptprogramm
+if __name__ == "__main__":
+    comparison = compare_versions()
+    print(f"Paired differences of the overall average time to '{VERSIONS[0][0]}'")
+    print(comparison.to_string())
@@ -1,69 +1,57 @@
-import math
-import simpy
-import random
-import os
-import csv
-import pandas as pd
-import matplotlib.pyplot as plt
-
-"""
-    This part of the program is to compare the standard version of the different versions
-    of Task 3 and produces graphic output
-"""
-
-#Loading raw patient from different Versions to dataframes
-df_v0 = pd.read_csv(
-        r'raw_data\Task1.csv',
-        engine='python', sep=';', header=0)
-
-df_v1 = pd.read_csv(
-        r'raw_data\Task3.csv',
-        engine='python', sep=';', header=0)
-df_v2 = pd.read_csv(
-        r'raw_data\Task3v2.csv',
-        engine='python', sep=';', header=0)
-df_v3 = pd.read_csv(
-        r'raw_data\Task3v3.csv',
-        engine='python', sep=';', header=0)
-df_v4 = pd.read_csv(
-        r'raw_data\Task3v4.csv',
-        engine='python', sep=';', header=0)
-
-version =[df_v0, df_v1, df_v2 ,df_v3 ,df_v4]
-mean = []
-std = []
-#calculate mean and standard Deviation for the raw patient data
-for dataframe in version:
-        mean.append(dataframe["Total Time"].mean())
-        std.append(dataframe["Total Time"].std())
-
-#Name of different Version
-version_name = ["No Priority","Priority 2nd Time CW","Priority CW always","Priority by Arrival Time in CW","Priority 2nd Time CW conditional"]
-
-#barpolt for average Time per Version
-plt.figure(figsize=(12, 9))
-plt.grid(axis = "y", alpha = 0.5)
-plt.title(label= "Average Time by Version",fontsize=20, pad=30)
-plt.bar(version_name,height = mean,color="red", width= 0.5)
-plt.xlabel(xlabel="Version",fontsize=20,labelpad = -5)
-plt.xticks(rotation=12)
-plt.ylabel(ylabel="Time(min)",fontsize=20, labelpad = 20)
-plt.show()
-
-#barplot for Standard Deviation per Verion
-plt.figure(figsize=(12, 9))
-plt.grid(axis = "y", alpha = 0.5)
-plt.title(label= "Standard Deviation by Version",fontsize=20, pad=30)
-plt.bar(x= version_name,height = std,label="Bars 1",color="blue", width = 0.5)
-plt.xlabel(xlabel="Version",fontsize=20,labelpad = -5)
-plt.xticks(rotation=12)
-plt.ylabel(ylabel="Time(min)",fontsize=20, labelpad = 20)
-plt.show()
-
-#showing Table for Barplots
-tmp_df =pd.DataFrame({'Version' : version_name,
-                                'Mean' : mean,
-                                'Standard Deviation' : std },
-                                columns=['Version','Mean', 'Standard Deviation'])
-tmp_df.set_index("Version", inplace= True)
-print(tmp_df.to_string())
\ No newline at end of file
+import os
+import pandas as pd
+from raw_data_sink import load_raw_data
+from figure_report import bar_figure, render_figures
+
+"""
+    This part of the program is to compare the standard version of the different versions
+    of Task 3 and produces graphic output
+"""
+
+#Loading raw patient data from different Versions
+#The columnar .npy files are memory-mapped, so nothing gets parsed or copied; CSV is the fallback
+def load_version(name):
+    """
+    Loads the raw patient data of one version
+
+    Parameters:
+        name (str): Name of the raw data file without extension
+
+    Returns:
+        memmap or DataFrame: raw patient data with one column per field
+    """
+    npy_file = os.path.join("raw_data", name + ".npy")
+    if os.path.exists(npy_file):
+        return load_raw_data(npy_file)
+    return pd.read_csv(os.path.join("raw_data", name + ".csv"), sep=';', header=0)
+
+# Hauptprogramm, the figures are rendered in worker processes which import this module
+if __name__ == "__main__":
+    version = [load_version(name) for name in ["Task1", "Task3", "Task3v2", "Task3v3", "Task3v4"]]
+    mean = []
+    std = []
+    #calculate mean and standard Deviation for the raw patient data
+    for data in version:
+            mean.append(data["Total Time"].mean())
+            std.append(data["Total Time"].std(ddof=1))
+
+    #Name of different Version
+    version_name = ["No Priority","Priority 2nd Time CW","Priority CW always","Priority by Arrival Time in CW","Priority 2nd Time CW conditional"]
+
+    #barpolt for average Time per Version and barplot for Standard Deviation per Verion
+    labels = {"xlabel": "Version", "ylabel": "Time(min)", "figsize": (12, 9), "grid": "y", "fontsize": 20,
+              "xlabelpad": -5, "rotation": 12}
+    render_figures([
+        bar_figure("Task3_average_time_by_version", version_name, mean, title="Average Time by Version",
+                   color="red", width=0.5, **labels),
+        bar_figure("Task3_std_by_version", version_name, std, title="Standard Deviation by Version",
+                   color="blue", width=0.5, **labels),
+    ])
+
+    #showing Table for Barplots
+    tmp_df =pd.DataFrame({'Version' : version_name,
+                                    'Mean' : mean,
+                                    'Standard Deviation' : std },
+                                    columns=['Version','Mean', 'Standard Deviation'])
+    tmp_df.set_index("Version", inplace= True)
+    print(tmp_df.to_string())
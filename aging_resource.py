@@ -0,0 +1,193 @@
+import heapq
+import itertools
+import math
+import simpy
+from simpy.core import BoundClass
+from simpy.resources.resource import PriorityRequest
+
+"""
+    Priority resource whose priorities are evaluated when a server becomes free (with aging).
+
+    With simpy.PriorityResource the priority of a request is fixed when the request is made.
+    A patient who crosses a limit while waiting (e.g. 60 minutes in the emergency room) keeps
+    the priority of the time of the request. Re-queuing all waiting requests whenever time
+    passes would cost O(n) per dispatch.
+
+    AgingPriorityResource takes a policy with the priority function of a request at a time and
+    the time the priority of a request changes next. The policy has to be time-monotone: the
+    priority only changes at times that are known in advance (aging, thresholds). The queue keeps
+    two heaps, the requests by their current priority and the next change of every request by
+    time. When the resource looks for the next request to grant, the due changes are applied
+    (the request is pushed with its new priority, its old entry is skipped when it comes up) and
+    the head of the queue is the request with the best priority at that time. Every change
+    costs O(log n) once, so an aging policy costs about the same as a static one.
+
+    Ties are granted like in simpy.PriorityResource: by the time of the request, then in the
+    order of the requests.
+"""
+
+
+class StaticPriority:
+    """
+    Policy of simpy.PriorityResource, the priority of the request never changes
+    """
+
+    def priority(self, request, now):
+        return request.priority
+
+    def next_change(self, request, now):
+        return math.inf
+
+
+class ThresholdAging:
+    """
+    Policy that gives a request a better priority once its patient has been in the emergency
+    room for a certain time. The patient of the request is its arrival time, requests without
+    patient keep their priority.
+    """
+
+    def __init__(self, threshold=60, promoted_priority=-1):
+        """
+        Parameters:
+            threshold (float): time in the emergency room after which a request is promoted
+            promoted_priority (int): priority of promoted requests, lower numbers first
+        """
+        self.threshold = threshold
+        self.promoted_priority = promoted_priority
+
+    def priority(self, request, now):
+        """
+        Returns:
+            int: priority of the request at time now
+        """
+        if request.patient is not None and now >= request.patient + self.threshold:
+            return min(request.priority, self.promoted_priority)
+        return request.priority
+
+    def next_change(self, request, now):
+        """
+        Returns:
+            float: time of the promotion, inf if the request has been promoted or won't be
+        """
+        if request.patient is not None and now < request.patient + self.threshold:
+            return request.patient + self.threshold
+        return math.inf
+
+
+class AgingRequest(PriorityRequest):
+    """
+    Request of an AgingPriorityResource with the patient the priority depends on
+    """
+
+    def __init__(self, resource, priority=0, preempt=True, patient=None):
+        """
+        Parameters:
+            resource (AgingPriorityResource): requested resource
+            priority (int): priority of the request at the time of the request, lower numbers first
+            preempt (bool): ignored like by simpy.PriorityResource
+            patient (optional): data of the patient the policy uses (e.g. its arrival time)
+        """
+        self.patient = patient
+        super().__init__(resource, priority, preempt)
+
+
+class AgingQueue:
+    """
+    Put queue ordered by the priorities of the requests at the current time of the environment,
+    with the queue interface SimPy needs (append, pop, __getitem__, __len__, remove)
+    """
+
+    def __init__(self, env, policy):
+        """
+        Parameters:
+            env (Environment): environment of the resource
+            policy: priority(request, now) and next_change(request, now) of the requests
+        """
+        self.env = env
+        self.policy = policy
+        self.heap = []
+        self.changes = []
+        self.entries = {}
+        self.sequence = itertools.count()
+
+    def _push(self, request, now, sequence):
+        """
+        Adds the request with its priority at time now, a previous entry of it becomes stale
+        """
+        entry = (self.policy.priority(request, now), request.time, not request.preempt, sequence, request)
+        self.entries[request] = entry
+        heapq.heappush(self.heap, entry)
+        change = self.policy.next_change(request, now)
+        if change < math.inf:
+            heapq.heappush(self.changes, (change, sequence, request))
+
+    def _refresh(self):
+        """
+        Applies the changes of priority that are due and drops stale entries from the head of the heap
+        """
+        now = self.env.now
+        changes = self.changes
+        while changes and changes[0][0] <= now:
+            change, sequence, request = heapq.heappop(changes)
+            if request in self.entries:
+                self._push(request, now, sequence)
+        heap = self.heap
+        while heap and self.entries.get(heap[0][-1]) is not heap[0]:
+            heapq.heappop(heap)
+
+    def append(self, request):
+        self._push(request, self.env.now, next(self.sequence))
+
+    def __getitem__(self, index):
+        self._refresh()
+        if index == 0:
+            return self.heap[0][-1]
+        return self._ordered()[index]
+
+    def pop(self, index=0):
+        """
+        Removes and returns the request at the position in the current order of the queue
+        """
+        self._refresh()
+        request = heapq.heappop(self.heap)[-1] if index == 0 else self._ordered()[index]
+        del self.entries[request]
+        return request
+
+    def remove(self, request):
+        """
+        Removes a cancelled request, its entries are skipped when they come up
+        """
+        del self.entries[request]
+
+    def _ordered(self):
+        """
+        Returns:
+            list: waiting requests in the current order
+        """
+        return [entry[-1] for entry in sorted(self.entries.values())]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        self._refresh()
+        return iter(self._ordered())
+
+
+class AgingPriorityResource(simpy.PriorityResource):
+    """
+    simpy.PriorityResource with the priorities of the waiting requests evaluated by a policy
+    when a server becomes free
+    """
+
+    def __init__(self, env, capacity=1, policy=None):
+        """
+        Parameters:
+            env (Environment): environment of the resource
+            capacity (int): Number of servers
+            policy (optional): priority policy, StaticPriority if not given
+        """
+        super().__init__(env, capacity)
+        self.put_queue = AgingQueue(env, policy if policy is not None else StaticPriority())
+
+    request = BoundClass(AgingRequest)
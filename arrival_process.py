@@ -0,0 +1,343 @@
+import numpy as np
+from variate_pool import bound_variates
+
+"""
+    Non-homogeneous Poisson arrivals (hour of day and weekday patterns) from a rate table.
+
+    generate_patients draws the interarrival times from a constant rate of 1/0.3 patients per
+    minute. A RateTable describes the arrival rate over a period (a day of 1440 or a week of
+    10080 minutes) by its rates at breakpoints, piecewise constant or piecewise linear between
+    them. The cumulative intensity at the breakpoints is computed once with the table.
+
+    NHPPArrivals generates the arrivals in vectorized blocks by inversion: the arrival times of a
+    unit rate Poisson process (cumulative sums of exponential values) are mapped through the
+    inverse of the cumulative intensity, which is linear (constant rates) or quadratic (linear
+    rates) on every segment and solved in closed form for the whole block. For rate functions
+    without a table (any vectorized function of time with a known maximum) the arrivals come from
+    thinning a homogeneous process at the maximum rate, also in blocks.
+
+    The simulation gets the interarrival times one by one from interarrival_times, so a
+    realistic demand curve costs about the same per arrival as the constant rate.
+"""
+
+# Mean interarrival time of the homogeneous arrivals of generate_patients
+MEAN_INTERARRIVAL_TIME = 0.3
+
+# Number of arrivals generated at once
+BLOCK_SIZE = 4096
+
+# Minutes of a day and of a week
+DAY = 1440
+WEEK = 7 * DAY
+
+
+class RateTable:
+    """
+    Arrival rate over a period from the rates at breakpoints, repeated every period
+    """
+
+    def __init__(self, times, rates, period=DAY, kind="constant"):
+        """
+        Parameters:
+            times (list): breakpoints in minutes of the period, increasing and starting at 0
+            rates (list): arrival rate (patients per minute) at every breakpoint
+            period (float): length of the period in minutes, e.g. DAY or WEEK
+            kind (str): "constant" for the rate of a breakpoint up to the next one, "linear" for
+                rates interpolated between the breakpoints (back to the first rate at the end of the period)
+        """
+        times = np.asarray(times, dtype=np.float64)
+        rates = np.asarray(rates, dtype=np.float64)
+        if len(times) == 0 or len(times) != len(rates):
+            raise ValueError("Rate table needs one rate per breakpoint")
+        if times[0] != 0 or np.any(np.diff(times) <= 0) or times[-1] >= period:
+            raise ValueError("Breakpoints must increase from 0 and lie within the period")
+        if np.any(rates < 0) or not np.all(np.isfinite(rates)):
+            raise ValueError("Rates must be finite and not negative")
+        if kind not in ("constant", "linear"):
+            raise ValueError(f"Unknown kind of rate table: {kind}")
+
+        self.times = times
+        self.rates = rates
+        self.period = float(period)
+        self.kind = kind
+
+        # Segments between the breakpoints: start, length, rate at the start and slope
+        self.lengths = np.diff(np.append(times, self.period))
+        if kind == "linear":
+            self.slopes = (np.roll(rates, -1) - rates) / self.lengths
+        else:
+            self.slopes = np.zeros(len(rates))
+
+        # Cumulative intensity at the start of every segment and over the whole period
+        masses = rates * self.lengths + self.slopes * self.lengths ** 2 / 2
+        self.cumulative = np.concatenate(([0.0], np.cumsum(masses)))
+        self.total = float(self.cumulative[-1])
+        if self.total <= 0:
+            raise ValueError("Rate table without arrivals")
+
+    def __repr__(self):
+        return (f"RateTable(times={self.times.tolist()}, rates={self.rates.tolist()}, period={self.period}, "
+                f"kind={self.kind!r})")
+
+    def key(self):
+        """
+        Returns:
+            dict: content of the table, the key of the table in a cached run
+        """
+        return {"times": self.times.tolist(), "rates": self.rates.tolist(), "period": self.period, "kind": self.kind}
+
+    @classmethod
+    def weekly(cls, hourly_rates, weekday_factors=(1, 1, 1, 1, 1, 1, 1), kind="linear"):
+        """
+        Week of hourly rates: a daily curve scaled for every weekday (starting with Monday 0:00)
+
+        Parameters:
+            hourly_rates (list): 24 arrival rates (patients per minute) at the full hours of a day
+            weekday_factors (list): 7 factors of the daily curve, Monday first
+            kind (str): "constant" or "linear", see RateTable
+
+        Returns:
+            RateTable: table over a WEEK with 168 breakpoints
+        """
+        if len(hourly_rates) != 24 or len(weekday_factors) != 7:
+            raise ValueError("Weekly rates need 24 hourly rates and 7 weekday factors")
+        rates = np.outer(weekday_factors, hourly_rates).ravel()
+        return cls(np.arange(len(rates)) * 60.0, rates, WEEK, kind)
+
+    @property
+    def mean_rate(self):
+        """
+        Returns:
+            float: mean arrival rate over the period in patients per minute
+        """
+        return self.total / self.period
+
+    def scaled(self, mean_rate):
+        """
+        Parameters:
+            mean_rate (float): mean arrival rate of the new table, e.g. 1 / 0.3
+
+        Returns:
+            RateTable: table of the same shape with the given mean rate
+        """
+        return RateTable(self.times, self.rates * (mean_rate / self.mean_rate), self.period, self.kind)
+
+    def rate(self, t):
+        """
+        Parameters:
+            t (ndarray): times in minutes
+
+        Returns:
+            ndarray: arrival rate at the times
+        """
+        t = np.mod(np.asarray(t, dtype=np.float64), self.period)
+        segment = np.searchsorted(self.times, t, side="right") - 1
+        return self.rates[segment] + self.slopes[segment] * (t - self.times[segment])
+
+    def cumulative_intensity(self, t):
+        """
+        Parameters:
+            t (ndarray): times in minutes
+
+        Returns:
+            ndarray: expected number of arrivals from 0 to the times
+        """
+        t = np.asarray(t, dtype=np.float64)
+        periods, t = np.divmod(t, self.period)
+        segment = np.searchsorted(self.times, t, side="right") - 1
+        dt = t - self.times[segment]
+        return (periods * self.total + self.cumulative[segment] + self.rates[segment] * dt
+                + self.slopes[segment] * dt * dt / 2)
+
+    def inverse(self, s):
+        """
+        Inverse of the cumulative intensity
+
+        Parameters:
+            s (ndarray): expected numbers of arrivals, not negative
+
+        Returns:
+            ndarray: earliest times with these cumulative intensities
+        """
+        s = np.asarray(s, dtype=np.float64)
+        periods, s = np.divmod(s, self.total)
+        # Segments without arrivals are skipped, they have no mass
+        segment = np.minimum(np.searchsorted(self.cumulative[1:], s, side="right"), len(self.times) - 1)
+        x = s - self.cumulative[segment]
+        a = self.rates[segment]
+        b = self.slopes[segment]
+        # Root of a dt + b dt^2 / 2 = x, in the form without cancellation for b close to 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            dt = 2 * x / (a + np.sqrt(np.maximum(a * a + 2 * b * x, 0.0)))
+        dt = np.where(x > 0, np.minimum(dt, self.lengths[segment]), 0.0)
+        return periods * self.period + self.times[segment] + dt
+
+
+class NHPPArrivals:
+    """
+    Non-homogeneous Poisson arrivals from a RateTable (inversion) or a rate function (thinning)
+    """
+
+    def __init__(self, rates, max_rate=None, start=0.0, block_size=BLOCK_SIZE):
+        """
+        Parameters:
+            rates (RateTable or function): rate table, or vectorized rate function of the time in minutes
+            max_rate (float, optional): upper bound of the rate function, needed for thinning. With a
+                rate table the arrivals are thinned instead of inverted if given
+            start (float): time of the rate table at simulation time 0, e.g. 8 * 60 for 8:00
+            block_size (int): Number of arrivals generated at once
+        """
+        if not isinstance(rates, RateTable) and max_rate is None:
+            raise ValueError("Rate functions need a maximum rate for thinning")
+        self.rates = rates
+        self.max_rate = max_rate
+        self.start = float(start)
+        self.block_size = block_size
+
+    def __repr__(self):
+        return (f"NHPPArrivals({self.rates!r}, max_rate={self.max_rate}, start={self.start}, "
+                f"block_size={self.block_size})")
+
+    def key(self):
+        """
+        Returns:
+            dict: rate table and parameters, the key of the arrivals in a cached run. Rate functions
+                have no stable key, a ValueError is raised for them
+        """
+        if not isinstance(self.rates, RateTable):
+            raise ValueError("Arrivals from a rate function have no stable key, use a RateTable")
+        return {"rates": self.rates.key(), "max_rate": self.max_rate, "start": self.start,
+                "block_size": self.block_size}
+
+    def arrival_times(self, generator, count):
+        """
+        Parameters:
+            generator (Generator): NumPy generator to draw from
+            count (int): Number of arrivals
+
+        Returns:
+            ndarray: increasing arrival times in simulation time
+        """
+        blocks = self.blocks(generator)
+        times = np.concatenate([next(blocks) for _ in range(-(-count // self.block_size))] or [np.zeros(0)])
+        return times[:count]
+
+    def blocks(self, generator):
+        """
+        Generates the arrival times block by block
+
+        Parameters:
+            generator (Generator): NumPy generator to draw from
+
+        Yields:
+            ndarray: next block_size arrival times in simulation time
+        """
+        if self.max_rate is None:
+            # Inversion: unit rate arrivals mapped through the inverse of the cumulative intensity
+            offset = float(self.rates.cumulative_intensity(self.start))
+            while True:
+                unit = offset + np.cumsum(generator.exponential(1.0, self.block_size))
+                offset = float(unit[-1])
+                yield self.rates.inverse(unit) - self.start
+        else:
+            # Thinning: candidates at the maximum rate, kept with probability rate / max_rate
+            rate = self.rates.rate if isinstance(self.rates, RateTable) else self.rates
+            last = self.start
+            pending = np.zeros(0)
+            while True:
+                while len(pending) < self.block_size:
+                    candidates = last + np.cumsum(generator.exponential(1 / self.max_rate, self.block_size))
+                    last = float(candidates[-1])
+                    accepted = generator.random(self.block_size) * self.max_rate < rate(candidates)
+                    pending = np.concatenate((pending, candidates[accepted]))
+                yield pending[:self.block_size] - self.start
+                pending = pending[self.block_size:]
+
+    def interarrival_times(self, generator):
+        """
+        Parameters:
+            generator (Generator): NumPy generator to draw from
+
+        Yields:
+            float: time from the previous arrival (from 0 for the first arrival)
+        """
+        last = 0.0
+        for times in self.blocks(generator):
+            gaps = np.diff(times, prepend=last)
+            last = float(times[-1])
+            yield from gaps.tolist()
+
+
+def interarrival_times(stream, arrivals=None):
+    """
+    Interarrival times of the patients for generate_patients and the fast engine
+
+    Parameters:
+        stream (random.Random or PooledRandom): arrival stream of the replication
+        arrivals (NHPPArrivals, optional): non-homogeneous arrivals, the constant rate 1/0.3 if not given
+
+    Yields:
+        float: time from the previous arrival
+    """
+    if arrivals is None:
+        # Drawn one by one when needed, so the draws are the same as without the generator
+        draw = bound_variates(stream, "expovariate", 1 / MEAN_INTERARRIVAL_TIME)
+        while True:
+            yield draw()
+    # The NumPy generator of the blocks is seeded from the stream, so it depends on seed and replication
+    seed = [int(stream.random() * 2 ** 53) for _ in range(4)]
+    yield from arrivals.interarrival_times(np.random.default_rng(seed))
+
+
+def compare_generators(count=1000000, rates=None):
+    """
+    Wall time per arrival of the homogeneous expovariate draws and of the NHPP generators,
+    and the relative error of the number of arrivals per hour against the rate table
+
+    Parameters:
+        count (int): Number of arrivals per generator
+        rates (RateTable, optional): rate table, the example weekly curve if not given
+
+    Returns:
+        dict: nanoseconds per arrival by generator and the maximum relative error per hour
+    """
+    import time
+    import random
+
+    rates = rates if rates is not None else EXAMPLE_WEEK
+    results = {}
+    for name, arrivals in (("homogeneous", None), ("inversion", NHPPArrivals(rates)),
+                           ("thinning", NHPPArrivals(rates, max_rate=rates.rates.max()))):
+        gaps = interarrival_times(random.Random(1), arrivals)
+        start = time.perf_counter()
+        now = 0.0
+        for _ in range(count):
+            now += next(gaps)
+        results[name] = (time.perf_counter() - start) / count * 1e9
+
+    # Arrivals per hour of the week over many weeks against the integral of the rate
+    times = NHPPArrivals(rates).arrival_times(np.random.default_rng(1), count)
+    weeks = int(times[-1] // rates.period)
+    hours = np.arange(int(rates.period // 60) + 1) * 60.0
+    expected = np.diff(rates.cumulative_intensity(hours)) * weeks
+    counted = np.bincount((np.mod(times[times < weeks * rates.period], rates.period) // 60).astype(np.int64),
+                          minlength=len(expected))[:len(expected)]
+    results["max_relative_error"] = float(np.max(np.abs(counted - expected) / expected))
+    return results
+
+
+# Example of a week with a peak around noon, fewer patients at night and at the weekend,
+# scaled to the mean rate of the homogeneous arrivals
+EXAMPLE_WEEK = RateTable.weekly(
+    [0.4, 0.3, 0.25, 0.2, 0.2, 0.25, 0.4, 0.7, 1.0, 1.2, 1.3, 1.35,
+     1.3, 1.25, 1.2, 1.15, 1.1, 1.1, 1.05, 1.0, 0.9, 0.8, 0.65, 0.5],
+    weekday_factors=(1.2, 1.05, 1.0, 1.0, 1.05, 0.85, 0.85),
+).scaled(1 / MEAN_INTERARRIVAL_TIME)
+
+
+# Hauptprogramm
+if __name__ == "__main__":
+    results = compare_generators()
+    for name in ("homogeneous", "inversion", "thinning"):
+        print(f"{name:>12}: {results[name]:6.1f} ns per arrival")
+    print(f"Max. relative error of the arrivals per hour: {100 * results['max_relative_error']:.2f}%")
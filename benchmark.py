@@ -0,0 +1,197 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import importlib
+import contextlib
+import subprocess
+from datetime import datetime
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+from simulation_profile import SimulationProfiler
+
+"""
+    Benchmark of run_simulation of every Task variant at several numbers of patients.
+
+    Every case (variant, engine, num_patients) runs in a fresh worker process, so the peak RSS of
+    the process is the peak of that case alone. The wall time of the whole run_simulation call
+    (simulation and statistics) gives the patients per second, the events counted by a light
+    SimulationProfiler (no memory tracing, no process timing) give the events per second of the
+    simulation itself.
+
+    The results are stored as JSON named after the commit, e.g. results/benchmarks/1a2b3c4.json.
+    Given a baseline file, every case is compared with the same case of the baseline and the
+    benchmark fails (exit status 1) when the throughput dropped by more than the tolerance.
+
+    Usage:
+        python benchmark.py --scales 250 10000 --baseline results/benchmarks/1a2b3c4.json
+"""
+
+VARIANTS = ("Task_1", "Task_2", "Task_3", "Task_3v2", "Task_3v3", "Task_3v4")
+SCALES = (250, 10000, 100000, 1000000)
+ENGINES = ("simpy", "fast")
+DIRECTORY = os.path.join("results", "benchmarks")
+
+
+def run_case(variant, num_patients, engine, seed=10, repeat=1):
+    """
+    Runs one case in the current process, meant to be the only case of a worker process
+
+    Parameters:
+        variant (str): name of the Task module
+        num_patients (int): Number of patients
+        engine (str): engine of run_simulation ("simpy" or "fast")
+        seed (int): Root seed of the runs
+        repeat (int): Number of runs, the fastest one is kept
+
+    Returns:
+        dict: measurements of the case
+    """
+    module = importlib.import_module(variant)
+    best = None
+    for replication in range(repeat):
+        profiler = SimulationProfiler(memory=False, processes=False)
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            results, stats = module.run_simulation(num_patients=num_patients, seed=seed, replication=replication,
+                                                   keep_patients=False, profile=profiler, engine=engine, save=False)
+        wall_time = time.perf_counter() - start
+        if best is None or wall_time < best["wall_time"]:
+            profile = results["profile"]
+            best = {
+                "wall_time": wall_time,
+                "events": profile["events"],
+                "events_per_second": profile["events_per_second"],
+                "patients_per_second": num_patients / wall_time,
+            }
+
+    # Maximum resident set size of the process, kilobytes on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        peak_rss *= 1024
+    return {"variant": variant, "engine": engine, "num_patients": num_patients, **best, "peak_rss": peak_rss}
+
+
+def run_benchmark(variants=VARIANTS, scales=SCALES, engines=ENGINES, seed=10, repeat=1):
+    """
+    Runs every case in a fresh worker process, one after the other so the cases don't compete for the CPU
+
+    Parameters:
+        variants (tuple): names of the Task modules
+        scales (tuple): numbers of patients
+        engines (tuple): engines of run_simulation
+        seed (int): Root seed of the runs
+        repeat (int): Number of runs per case, the fastest one is kept
+
+    Returns:
+        list: measurements of every case
+    """
+    cases = []
+    context = get_context("spawn")
+    for num_patients in scales:
+        for variant in variants:
+            for engine in engines:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    case = executor.submit(run_case, variant, num_patients, engine, seed, repeat).result()
+                print(f"{variant:<9} {engine:<6} {num_patients:>8} patients: {case['wall_time']:9.3f} s, "
+                      f"{case['events_per_second']:10.0f} events/s, {case['patients_per_second']:10.0f} patients/s, "
+                      f"{case['peak_rss'] / 2 ** 20:7.1f} MB")
+                cases.append(case)
+    return cases
+
+
+def commit():
+    """
+    Returns:
+        str: short hash of the checked out commit, with "-dirty" if there are uncommitted changes
+    """
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{revision}-dirty" if dirty else revision
+
+
+def save_benchmark(cases, directory=DIRECTORY):
+    """
+    Saves the measurements as JSON named after the commit
+
+    Parameters:
+        cases (list): measurements of every case
+        directory (str): directory of the benchmark files, generated if it doesn't exist
+
+    Returns:
+        str: path of the file
+    """
+    os.makedirs(directory, exist_ok=True)
+    revision = commit()
+    benchmark = {
+        "commit": revision,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cases": cases,
+    }
+    filename = os.path.join(directory, f"{revision}.json")
+    with open(filename, "w") as file:
+        json.dump(benchmark, file, indent=2)
+    return filename
+
+
+def compare(cases, baseline, tolerance=0.1):
+    """
+    Compares the throughput of every case with the same case of a baseline
+
+    Parameters:
+        cases (list): measurements of every case
+        baseline (str): path of the benchmark file to compare with
+        tolerance (float): allowed relative drop of the throughput
+
+    Returns:
+        list: description of every regression, empty if there is none
+    """
+    with open(baseline) as file:
+        previous = {(case["variant"], case["engine"], case["num_patients"]): case for case in json.load(file)["cases"]}
+
+    regressions = []
+    for case in cases:
+        reference = previous.get((case["variant"], case["engine"], case["num_patients"]))
+        if reference is None:
+            continue
+        for metric in ("events_per_second", "patients_per_second"):
+            if case[metric] < (1 - tolerance) * reference[metric]:
+                regressions.append(f"{case['variant']} {case['engine']} {case['num_patients']} patients: {metric} "
+                                   f"{case[metric]:.0f} < {reference[metric]:.0f} "
+                                   f"({case[metric] / reference[metric] - 1:+.1%})")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the Task variants")
+    parser.add_argument("--variants", nargs="+", default=VARIANTS)
+    parser.add_argument("--scales", nargs="+", type=int, default=SCALES)
+    parser.add_argument("--engines", nargs="+", default=ENGINES, choices=ENGINES)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--baseline", help="benchmark file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative drop of the throughput")
+    arguments = parser.parse_args()
+
+    cases = run_benchmark(arguments.variants, arguments.scales, arguments.engines, repeat=arguments.repeat)
+
+    # The baseline is read before saving, it may be the file of the same commit
+    regressions = compare(cases, arguments.baseline, arguments.tolerance) if arguments.baseline else []
+    print(f"Saved {save_benchmark(cases)}")
+
+    if arguments.baseline:
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression beyond {arguments.tolerance:.0%}")
@@ -0,0 +1,560 @@
+import os
+import heapq
+import math
+import statistics
+import contextlib
+import gc
+import numpy as np
+from collections import deque
+from functools import partial
+from resource_usage import RESOURCE_NAMES, ResourceUsage
+from running_statistics import RunningStatistics
+from stage_times import STAGE_ROUTES
+from variate_pool import BLOCK_SIZE, sample_triangular
+from arrival_process import interarrival_times
+from random_streams import STREAM_NAMES
+from simulation_profile import SimulationProfiler
+
+"""
+    Fast simulation engine for the emergency room network without SimPy.
+
+    The network is fixed: registration, CW1/CW2, X-ray and plaster with capacities 1/2/2/2/1.
+    Instead of a generator, Request event and callbacks per step, the engine keeps a plain heapq
+    event list and the state of every resource in integer indexed lists (busy servers and a queue).
+    Routing, the doctors arriving at t=30, the CW2 queue limit of Task 2 and the priority rules of
+    the Task 3 versions are the same as in the SimPy model, so the results are statistically the
+    same (see validate_against_simpy).
+
+    The registration is a single FIFO server visited first, so the end of the registration of a
+    patient follows from the previous one and is scheduled when the patient is admitted, there
+    are no events for arrivals. Every priority of a casualty ward queue is a deque of its own
+    (promoted patients go to a heap next to it), so queueing costs O(1) even with thousands of
+    waiting patients. The cyclic garbage collector is paused during the event loop.
+
+    The running statistics and the patient records are the same objects as in the SimPy model,
+    so calc_statistics and the save functions work unchanged. The departures and stage rows are
+    collected in plain lists and handed to the records in blocks, without keep_patients nothing
+    is collected. The variates are drawn in NumPy blocks from generators seeded from the random
+    number streams of the replication, so the draws depend on seed, replication and (with common
+    random numbers) the stage like in the SimPy model, but they are not the same values.
+
+    check_speedup measures the simulation of both engines without records (measure_speedup) and
+    fails below TARGET_SPEEDUP. Measured at 20000 patients: 13-19x for all Task variants, at
+    250 patients 11-12x, where the set up of a run weighs more. Whole run_simulation calls with records gain less, the records and
+    calc_statistics cost the same with both engines.
+"""
+
+# Resources, a patient's step WARD means the casualty ward chosen after registration
+REGISTRATION, CW1, CW2, X_RAY, PLASTER, WARD = range(6)
+CAPACITIES = (1, 2, 2, 2, 1)
+
+# Parameters of the triangular service time distributions (same order as in stage_draws)
+SERVICE_TIMES = {
+    REGISTRATION: (0.2, 0.5, 1.0),
+    CW1: (1.5, 3.2, 5.0),
+    CW2: (2.8, 4.1, 6.3),
+    X_RAY: (2.0, 2.8, 4.1),
+    PLASTER: (3.0, 3.8, 4.7),
+}
+
+# Steps of every patient type
+ROUTES = {
+    1: (REGISTRATION, WARD, X_RAY, WARD),
+    2: (REGISTRATION, WARD, PLASTER),
+    3: (REGISTRATION, WARD, X_RAY, PLASTER, X_RAY, WARD),
+    4: (REGISTRATION, WARD),
+}
+
+# Steps of every patient type once the casualty ward is chosen, by type and ward
+WARD_ROUTES = {patient_type: {ward: tuple(ward if step == WARD else step for step in route) for ward in (CW1, CW2)}
+               for patient_type, route in ROUTES.items()}
+
+# Number of the visit of the casualty ward at every step of the route, 0 for the other resources
+WARD_VISITS = {patient_type: tuple(route[:step + 1].count(WARD) if resource == WARD else 0
+                                   for step, resource in enumerate(route))
+               for patient_type, route in ROUTES.items()}
+
+# Time the doctors arrive in the casualty wards
+DOCTORS_ARRIVAL = 30
+
+# Patient types and their cumulative weights, as in generate_patients
+PATIENT_TYPES = (1, 2, 3, 4)
+PATIENT_TYPE_CUM_WEIGHTS = np.cumsum((35, 20, 5, 40), dtype=float)
+
+# Speedup of the simulation over the SimPy model the engine has to reach, measured on runs of
+# SPEEDUP_PATIENTS patients so the set up of a run doesn't dominate
+TARGET_SPEEDUP = 10.0
+SPEEDUP_PATIENTS = 20000
+
+# Kinds of events
+SERVICE_END, DOCTORS_READY = range(2)
+
+# Number of departures handed to the patient and stage records at once
+RECORD_BLOCK = 4096
+
+
+def simulate(num_patients, streams, stats, cw_priority=None, cw_limit=None, cw2_probability=0.4,
+             cw_promotion=None, arrivals=None):
+    """
+    Simulates the emergency room with a heapq event list
+
+    Parameters:
+        num_patients (int): Number of patients for simulation
+        streams (ReplicationStreams): random number streams of the replication
+        stats (dict): running statistics and (optional) records of the patients, filled at departure,
+            and the usage of the resources
+        cw_priority (function, optional): priority in the casualty wards as function of
+            (patient_type, visit, arrival_time, now), lower numbers first. FIFO if not given
+        cw_limit (int, optional): Max queue size of casualty ward 2 (Task 2 routing), without it
+            60% of the patients go to CW1 (Task 1 routing)
+        cw2_probability (float): Probability of the allocation to CW2 with the Task 2 routing
+        cw_promotion (function, optional): promotion of a waiting patient in the casualty wards as
+            function of (patient_type, visit, arrival_time), returns (time, priority) or None. The
+            priority of a waiting patient drops to the given priority from that time on, so it is
+            evaluated when a doctor becomes free (like AgingPriorityResource)
+        arrivals (NHPPArrivals, optional): non-homogeneous arrivals, constant rate 1/0.3 if not given
+
+    Returns:
+        int: Number of processed events
+    """
+    heappush = heapq.heappush
+    heappop = heapq.heappop
+
+    # Service times, patient types, CW choices and interarrival times in vectorized blocks,
+    # handed out by a bound __next__ instead of a random.Random call per draw
+    generators = stream_generators(streams)
+    service = [variates(generators[name], partial(sample_triangular, low=low, high=high, mode=mode))
+               for name, (low, high, mode) in zip(
+                   ("registration", "cw1", "cw2", "x_ray", "plaster"),
+                   (SERVICE_TIMES[resource] for resource in range(5)))]
+    next_type = variates(generators["patient_type"], sample_patient_types)
+    next_choice = variates(generators["cw_choice"], lambda generator, size: generator.random(size))
+    if arrivals is None:
+        next_gap = variates(generators["arrival"], lambda generator, size: generator.exponential(0.3, size))
+    else:
+        next_gap = interarrival_times(streams.arrival, arrivals).__next__
+
+    # State of the resources: busy servers and waiting patients. Every service ends before the
+    # event list runs empty, so the busy server-time is the sum of the drawn service times
+    busy = [0, 0, 0, 0, 0]
+    busy_time = [0.0] * 5
+    completions = [0] * 5
+    capacities = CAPACITIES
+    prioritized = (False, cw_priority is not None, cw_priority is not None, False, False)
+
+    # Queues of the resources: FIFO resources have a deque. A priority queue is ordered by the
+    # priority, then by the order of the requests, so the patients of every priority wait in a
+    # deque of their own and only the priorities are kept in a heap (levels). With promotions the
+    # deques hold queue entries (sequence, patient) and every priority has a heap next to its
+    # deque for the promoted entries, which keep the sequence of their request; the older of both
+    # heads is served first.
+    queues = [{} if prioritized[resource] else deque() for resource in range(5)]
+    levels = [[] for resource in range(5)]
+    queued = [0] * 5
+    cw2_queue = queues[CW2]
+
+    # Pending promotions (time, sequence, queue entry, priority) of the waiting patients by
+    # resource. A waiting patient holds its current queue entry, entries it doesn't hold any more
+    # (served or promoted) are stale and skipped
+    promotions = [[] for _ in range(5)] if cw_promotion is not None else None
+
+    # The state of a patient is a list that travels with its events and is dropped at departure,
+    # so the memory depends on the patients in the system and not on the length of the run:
+    # [id, type, arrival time, step, requested, started, route, stage row, queue entry]. The route is the one
+    # of the patient type until the casualty ward is chosen, then the one with that ward. The
+    # times of the requests are only kept up to date for the stage rows
+    times = stats["times"]
+    records = stats["patients"]
+    stages = stats.get("stages")
+
+    # The departures and stage rows are collected in plain lists and handed to the records in
+    # blocks, without records nothing is collected
+    departed = [] if records is not None else None
+    staged = [] if stages is not None else None
+
+    # Count, sum and sum of squares of the total times (shifted by the first one) by patient type
+    totals = [[0, 0.0, 0.0, None] for patient_type in range(max(ROUTES) + 1)]
+
+    def admissions():
+        # The registration is a single FIFO server visited first in order of arrival, so the end
+        # of the registration of every patient follows from the previous one (Lindley recursion)
+        # and is scheduled at once. The next patient is admitted at the end of a registration,
+        # which is before its own. Events at the same time order by sequence, the registrations
+        # use negative ones.
+        arrival_time = 0.0
+        registration_free = 0.0
+        registration_time = service[REGISTRATION]
+        for patient_id in range(num_patients):
+            arrival_time += next_gap()
+            patient_type = next_type()
+            start = arrival_time if arrival_time > registration_free else registration_free
+            duration = registration_time()
+            busy_time[REGISTRATION] += duration
+            registration_free = start + duration
+            yield (registration_free, -1 - patient_id, SERVICE_END,
+                   [patient_id, patient_type, arrival_time, 0, arrival_time, start, ROUTES[patient_type],
+                    [patient_id, patient_type] + [math.nan] * 12 if staged is not None else None, None])
+    admit = admissions().__next__
+
+    events = []
+    sequence = 0
+    waited_for_doctors = 0
+    now = 0.0
+
+    # First patient
+    if num_patients > 0:
+        heappush(events, admit())
+
+    # Reference counting frees the patients, events and queue entries (a waiting patient and its
+    # entry refer to each other only until it is served), so the cyclic garbage collector is
+    # paused in the loop instead of scanning the state again and again
+    with collection_paused():
+        while events:
+            now, _, kind, patient = heappop(events)
+
+            if kind == SERVICE_END:
+                route = patient[6]
+                current = patient[3]
+                resource = route[current]
+
+                # Release the server, the next waiting patient takes it over at once (the
+                # registrations are scheduled at admission)
+                completions[resource] += 1
+                if resource != REGISTRATION:
+                    queue = queues[resource]
+                    following = None
+                    if not prioritized[resource]:
+                        if queue:
+                            following = queue.popleft()
+                    elif queued[resource]:
+                        queued[resource] -= 1
+                        waiting_levels = levels[resource]
+                        if promotions is None:
+                            # Without promotions no entry gets stale
+                            requested = queue[waiting_levels[0]]
+                            following = requested.popleft()
+                            if not requested:
+                                del queue[heappop(waiting_levels)]
+                        else:
+                            # The promotions that are due move their patients to the better priority
+                            pending = promotions[resource]
+                            while pending and pending[0][0] <= now:
+                                _, order, entry, priority = heappop(pending)
+                                waiting_patient = entry[1]
+                                if waiting_patient[8] is entry:
+                                    waiting_patient[8] = entry = (order, waiting_patient)
+                                    level = queue.get(priority)
+                                    if level is None:
+                                        level = queue[priority] = (deque(), [])
+                                        heappush(waiting_levels, priority)
+                                    heappush(level[1], entry)
+
+                            # Best priority with a patient still waiting, stale entries are dropped
+                            while True:
+                                requested, promoted = queue[waiting_levels[0]]
+                                while requested and requested[0][1][8] is not requested[0]:
+                                    requested.popleft()
+                                while promoted and promoted[0][1][8] is not promoted[0]:
+                                    heappop(promoted)
+                                if requested or promoted:
+                                    break
+                                del queue[heappop(waiting_levels)]
+                            if promoted and (not requested or promoted[0][0] < requested[0][0]):
+                                following = heappop(promoted)[1]
+                            else:
+                                following = requested.popleft()[1]
+                            following[8] = None
+                    if following is None:
+                        busy[resource] -= 1
+                    else:
+                        following[5] = now
+                        duration = service[resource]()
+                        busy_time[resource] += duration
+                        sequence += 1
+                        heappush(events, (now + duration, sequence, SERVICE_END, following))
+
+                # Wait and service time of the stage, the next request starts now
+                if staged is not None:
+                    stage = 2 * STAGE_ROUTES[patient[1]][current] + 2
+                    patient[7][stage] = patient[5] - patient[4]
+                    patient[7][stage + 1] = now - patient[5]
+                    patient[4] = now
+
+                current += 1
+                patient[3] = current
+                if current == len(route):
+                    # Departure
+                    total_time = now - patient[2]
+                    total = totals[patient[1]]
+                    if total[3] is None:
+                        total[3] = total_time
+                    deviation = total_time - total[3]
+                    total[0] += 1
+                    total[1] += deviation
+                    total[2] += deviation * deviation
+                    if departed is not None:
+                        departed.append((patient[0], patient[1], patient[2], now))
+                        if len(departed) >= RECORD_BLOCK:
+                            records.extend(departed)
+                            departed = []
+                    if staged is not None:
+                        staged.append(patient[7])
+                        if len(staged) >= RECORD_BLOCK:
+                            stages.extend(staged)
+                            staged = []
+                    continue
+                if current == 1:
+                    # Admission of the next patient
+                    if patient[0] + 1 < num_patients:
+                        heappush(events, admit())
+
+                    # Allocation to CW1 or CW2 after registration
+                    if cw_limit is None:
+                        ward = CW1 if next_choice() < 0.6 else CW2
+                    else:
+                        waiting_in_cw2 = queued[CW2] if prioritized[CW2] else len(cw2_queue)
+                        ward = CW2 if next_choice() < cw2_probability and waiting_in_cw2 < cw_limit else CW1
+                    patient[6] = route = WARD_ROUTES[patient[1]][ward]
+                    # Wait until doctors arrive
+                    if now < DOCTORS_ARRIVAL:
+                        waited_for_doctors += 1
+                        sequence += 1
+                        heappush(events, (DOCTORS_ARRIVAL, sequence, DOCTORS_READY, patient))
+                        continue
+                resource = route[current]
+
+            else:
+                resource = patient[6][1]
+
+            # Request of the resource: served at once by a free server, otherwise queued
+            if busy[resource] < capacities[resource]:
+                busy[resource] += 1
+                patient[5] = now
+                duration = service[resource]()
+                busy_time[resource] += duration
+                sequence += 1
+                heappush(events, (now + duration, sequence, SERVICE_END, patient))
+            elif prioritized[resource]:
+                visit = WARD_VISITS[patient[1]][patient[3]]
+                priority = cw_priority(patient[1], visit, patient[2], now)
+                queued[resource] += 1
+                level = queues[resource].get(priority)
+                if promotions is None:
+                    if level is None:
+                        level = queues[resource][priority] = deque()
+                        heappush(levels[resource], priority)
+                    level.append(patient)
+                else:
+                    if level is None:
+                        level = queues[resource][priority] = (deque(), [])
+                        heappush(levels[resource], priority)
+                    sequence += 1
+                    patient[8] = entry = (sequence, patient)
+                    level[0].append(entry)
+                    promotion = cw_promotion(patient[1], visit, patient[2])
+                    if promotion is not None and promotion[1] < priority:
+                        heappush(promotions[resource], (promotion[0], sequence, entry, promotion[1]))
+            else:
+                queues[resource].append(patient)
+
+    # The departures and stage rows of the last block
+    if departed:
+        records.extend(departed)
+    if staged:
+        stages.extend(staged)
+
+    # Total times of the departures, merged into the running statistics per patient type
+    for patient_type in ROUTES:
+        count, total, squares, shift = totals[patient_type]
+        if count:
+            mean = total / count
+            statistics_of_type = RunningStatistics.from_moments(count, shift + mean, max(squares - total * mean, 0.0))
+            times.types[patient_type].merge(statistics_of_type)
+            times.overall.merge(statistics_of_type)
+
+    # Busy time of the resources, the sum of the services of the run
+    stats["resources"] = {}
+    for resource, name in enumerate(RESOURCE_NAMES):
+        stats["resources"][name] = ResourceUsage.from_totals(CAPACITIES[resource], busy_time[resource],
+                                                             completions[resource], now)
+
+    # Every end of a service and wait for the doctors was one event
+    return sum(completions) + waited_for_doctors
+
+
+@contextlib.contextmanager
+def collection_paused():
+    """
+    Pauses the cyclic garbage collector, reference counting still frees the objects. The
+    collector is enabled again afterwards, unless it was disabled before.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def stream_generators(streams):
+    """
+    NumPy generators of the random number streams of a replication, seeded from the streams so
+    the draws depend on seed and replication. Streams that are the same object share their
+    generator: one for the whole replication by default, one per stage with common random numbers.
+
+    Parameters:
+        streams (ReplicationStreams): random number streams of the replication
+
+    Returns:
+        dict: generator by name of the stream
+    """
+    generators = {}
+    for name in STREAM_NAMES:
+        stream = getattr(streams, name)
+        if id(stream) not in generators:
+            generators[id(stream)] = np.random.default_rng([int(stream.random() * 2 ** 53) for _ in range(4)])
+    return {name: generators[id(getattr(streams, name))] for name in STREAM_NAMES}
+
+
+def variates(generator, sample, block_size=BLOCK_SIZE):
+    """
+    Draws of a distribution in vectorized blocks
+
+    Parameters:
+        generator (Generator): NumPy generator the blocks are drawn from
+        sample (function): draws a block as function of (generator, size)
+        block_size (int): Maximum number of values drawn at once, the first blocks are smaller
+            so short runs don't draw values they never use
+
+    Returns:
+        function: returns the next value with every call
+    """
+    def blocks():
+        size = min(256, block_size)
+        while True:
+            yield from sample(generator, size).tolist()
+            size = min(2 * size, block_size)
+    return blocks().__next__
+
+
+def sample_patient_types(generator, size):
+    """
+    Patient types with the weights of generate_patients, vectorized version of random.choices
+    """
+    return np.asarray(PATIENT_TYPES)[np.searchsorted(PATIENT_TYPE_CUM_WEIGHTS, generator.random(size)
+                                                     * PATIENT_TYPE_CUM_WEIGHTS[-1], side="right")]
+
+
+def validate_against_simpy(run_simulation, replications=50, **kwargs):
+    """
+    Runs a Task module with both engines and compares the overall average time
+
+    The replications of both engines use different random numbers (the engines draw in a
+    different order), so the difference of the means is tested against its standard error.
+
+    Parameters:
+        run_simulation (function): run_simulation function of one of the Task modules
+        replications (int): Number of replications per engine
+        **kwargs: further keyword arguments for run_simulation (e.g. num_patients)
+
+    Returns:
+        dict: mean and standard error of both engines and z value of their difference
+    """
+    summary = {}
+    for engine in ("simpy", "fast"):
+        times = [run_simulation(replication=replication, engine=engine, save=False, **kwargs)[0]["overall_avg_time"]
+                 for replication in range(replications)]
+        summary[engine] = {
+            "mean": statistics.mean(times),
+            "standard_error": statistics.stdev(times) / math.sqrt(replications),
+        }
+
+    difference = summary["fast"]["mean"] - summary["simpy"]["mean"]
+    standard_error = math.hypot(summary["fast"]["standard_error"], summary["simpy"]["standard_error"])
+    summary["z"] = difference / standard_error if standard_error else 0.0
+    return summary
+
+
+def measure_speedup(run_simulation, num_patients=SPEEDUP_PATIENTS, replications=3, **kwargs):
+    """
+    Measures the throughput of the simulation of both engines
+
+    Only the simulation itself is timed (the "simulation" section of a light SimulationProfiler),
+    without patient records, the set up of the streams and calc_statistics, which cost the
+    same with both engines. The engines process different events for the same patients (the
+    fast engine has no events for arrivals, requests and releases), so the speedup is the ratio
+    of the simulated patients per second, the events per second of every engine are reported too.
+
+    Parameters:
+        run_simulation (function): run_simulation function of one of the Task modules
+        num_patients (int): Number of patients per replication
+        replications (int): Number of replications per engine
+        **kwargs: further keyword arguments for run_simulation
+
+    Returns:
+        dict: events, wall time, events and patients per second of both engines and the speedup
+    """
+    summary = {}
+    for engine in ("simpy", "fast"):
+        events = 0
+        wall_time = 0.0
+        for replication in range(replications):
+            profiler = SimulationProfiler(memory=False, processes=False)
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                results, stats = run_simulation(num_patients=num_patients, replication=replication, engine=engine,
+                                                keep_patients=False, profile=profiler, save=False, **kwargs)
+            events += results["profile"]["events"]
+            wall_time += results["profile"]["wall_time simulation"]
+        summary[engine] = {
+            "events": events,
+            "wall_time": wall_time,
+            "events_per_second": events / wall_time,
+            "patients_per_second": num_patients * replications / wall_time,
+        }
+    summary["speedup"] = summary["fast"]["patients_per_second"] / summary["simpy"]["patients_per_second"]
+    return summary
+
+
+def check_speedup(run_simulation, target_speedup=TARGET_SPEEDUP, **kwargs):
+    """
+    Measures the speedup of the fast engine and fails if it is below the target
+
+    Parameters:
+        run_simulation (function): run_simulation function of one of the Task modules
+        target_speedup (float): speedup the fast engine has to reach
+        **kwargs: further keyword arguments for measure_speedup
+
+    Returns:
+        dict: measurements of measure_speedup
+    """
+    summary = measure_speedup(run_simulation, **kwargs)
+    if summary["speedup"] < target_speedup:
+        raise RuntimeError(f"Fast engine of {run_simulation.__module__} is {summary['speedup']:.1f}x faster than "
+                           f"SimPy, below the target of {target_speedup:.0f}x")
+    return summary
+
+
+# Hauptprogramm
+if __name__ == "__main__":
+    import Task_1
+    import Task_2
+    import Task_3
+    import Task_3v2
+    import Task_3v3
+    import Task_3v4
+
+    modules = (Task_1, Task_2, Task_3, Task_3v2, Task_3v3, Task_3v4)
+
+    # A |z| below 2 means the engines agree within the sampling noise
+    for module in modules:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            summary = validate_against_simpy(module.run_simulation)
+        print(f"{module.__name__}: SimPy {summary['simpy']['mean']:.2f}, fast {summary['fast']['mean']:.2f}, "
+              f"z = {summary['z']:.2f}")
+
+    # Raises for the first variant below the target
+    for module in modules:
+        summary = check_speedup(module.run_simulation)
+        print(f"{module.__name__}: {summary['speedup']:.1f}x, SimPy {summary['simpy']['events_per_second']:.0f} "
+              f"events/s, fast {summary['fast']['events_per_second']:.0f} events/s")
@@ -0,0 +1,233 @@
+import os
+import json
+import hashlib
+import matplotlib
+
+# Rendering to files only, no window is ever opened (headless servers, worker processes)
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+from matplotlib import cbook
+from concurrent.futures import ProcessPoolExecutor
+
+"""
+    Report stage that renders the figures of the main programs to files instead of showing them.
+
+    A figure is described by a FigureSpec: its kind (boxplot, bar or grouped bar), the
+    pre-aggregated data it shows (box statistics, bar heights) and its labels. The specs are
+    small and plain (lists, dicts and strings), so they are cheap to send to worker processes,
+    which render them with the Agg backend to PNG and SVG files.
+
+    Every spec has a hash of its kind, data, labels and the source of this module. The hashes of
+    the rendered figures are kept in a manifest in the figures directory, figures whose hash
+    hasn't changed and whose files exist are not rendered again.
+"""
+
+# Formats the figures are saved in
+FORMATS = ("png", "svg")
+
+# File with the hashes of the rendered figures
+MANIFEST = "figures.json"
+
+
+class FigureSpec:
+    """
+    Kind, data and labels of one figure
+    """
+
+    def __init__(self, name, kind, data, title="", xlabel="", ylabel="", figsize=(12, 8), **options):
+        """
+        Parameters:
+            name (str): file name of the figure without extension
+            kind (str): "boxplot", "bar" or "grouped_bar"
+            data (dict): pre-aggregated data of the figure, see boxplot_figure, bar_figure and grouped_bar_figure
+            title (str): title of the figure
+            xlabel (str): label of the x axis
+            ylabel (str): label of the y axis
+            figsize (tuple): size of the figure in inches
+            **options: further options of the kind (e.g. hlines, color, rotation, labelpad)
+        """
+        self.name = name
+        self.kind = kind
+        self.data = data
+        self.title = title
+        self.xlabel = xlabel
+        self.ylabel = ylabel
+        self.figsize = tuple(figsize)
+        self.options = options
+
+    def digest(self, version=""):
+        """
+        Parameters:
+            version (str): hash of the rendering code
+
+        Returns:
+            str: hash of everything the figure depends on
+        """
+        content = {"kind": self.kind, "data": self.data, "title": self.title, "xlabel": self.xlabel,
+                   "ylabel": self.ylabel, "figsize": self.figsize, "options": self.options, "version": version}
+        return hashlib.sha256(json.dumps(content, sort_keys=True, default=repr).encode()).hexdigest()
+
+
+def boxplot_figure(name, df, columns, **labels):
+    """
+    Boxplot of columns of the replications table, only the box statistics are kept
+
+    Parameters:
+        name (str): file name of the figure without extension
+        df (DataFrame): replications table
+        columns (list): columns with one box each
+        **labels: title, axis labels and options of FigureSpec (e.g. hlines)
+
+    Returns:
+        FigureSpec: spec of the figure
+    """
+    boxes = []
+    for column in columns:
+        values = df[column].dropna().to_numpy()
+        # Quartiles, whiskers at 1.5 IQR and outliers like DataFrame.boxplot
+        stats = cbook.boxplot_stats(values, labels=[column])[0]
+        boxes.append({key: stats[key].tolist() if hasattr(stats[key], "tolist") else stats[key]
+                      for key in ("label", "med", "q1", "q3", "whislo", "whishi", "fliers")})
+    return FigureSpec(name, "boxplot", {"boxes": boxes}, **labels)
+
+
+def bar_figure(name, labels, heights, **options):
+    """
+    Parameters:
+        name (str): file name of the figure without extension
+        labels (list): label of every bar
+        heights (list): height of every bar
+        **options: title, axis labels and options of FigureSpec (e.g. color, width)
+
+    Returns:
+        FigureSpec: spec of the figure
+    """
+    return FigureSpec(name, "bar", {"labels": list(labels), "heights": [float(height) for height in heights]},
+                      **options)
+
+
+def grouped_bar_figure(name, df, **options):
+    """
+    Bars grouped by the rows of a small frame, one bar per column in every group
+
+    Parameters:
+        name (str): file name of the figure without extension
+        df (DataFrame): groups as rows, bars as columns
+        **options: title, axis labels and options of FigureSpec (e.g. rotation)
+
+    Returns:
+        FigureSpec: spec of the figure
+    """
+    data = {"groups": [str(group) for group in df.index], "series": [str(column) for column in df.columns],
+            "values": df.to_numpy(dtype=float).tolist()}
+    return FigureSpec(name, "grouped_bar", data, **options)
+
+
+def render_figure(spec, directory="figures", formats=FORMATS):
+    """
+    Renders one figure with the Agg backend and saves it in every format
+
+    Parameters:
+        spec (FigureSpec): spec of the figure
+        directory (str): directory of the figure files
+        formats (tuple): file formats, e.g. ("png", "svg")
+
+    Returns:
+        str: name of the figure
+    """
+    options = spec.options
+    fig, ax = plt.subplots(figsize=spec.figsize)
+    try:
+        if spec.kind == "boxplot":
+            ax.bxp(spec.data["boxes"])
+            ax.grid(True)
+        elif spec.kind == "bar":
+            ax.bar(spec.data["labels"], spec.data["heights"], color=options.get("color"),
+                   width=options.get("width", 0.8))
+        elif spec.kind == "grouped_bar":
+            groups, series, values = spec.data["groups"], spec.data["series"], spec.data["values"]
+            width = 0.5 / len(series)
+            for index, label in enumerate(series):
+                positions = [group + (index - (len(series) - 1) / 2) * width for group in range(len(groups))]
+                ax.bar(positions, [row[index] for row in values], width, label=label)
+            ax.set_xticks(range(len(groups)), groups)
+            ax.legend()
+        else:
+            raise ValueError(f"Unknown kind of figure: {spec.kind}")
+
+        for hline in options.get("hlines", ()):
+            ax.axhline(**hline)
+        if options.get("grid"):
+            ax.grid(axis=options["grid"], alpha=0.5)
+        ax.set_title(spec.title, fontsize=20, pad=30)
+        ax.set_xlabel(spec.xlabel, fontsize=options.get("fontsize", 16), labelpad=options.get("xlabelpad", 10))
+        ax.set_ylabel(spec.ylabel, fontsize=options.get("fontsize", 16), labelpad=options.get("ylabelpad", 20))
+        if "rotation" in options:
+            plt.setp(ax.get_xticklabels(), rotation=options["rotation"], ha=options.get("ha", "center"))
+
+        fig.tight_layout()
+        for file_format in formats:
+            fig.savefig(os.path.join(directory, f"{spec.name}.{file_format}"))
+    finally:
+        plt.close(fig)
+    return spec.name
+
+
+def code_version():
+    """
+    Returns:
+        str: hash of the source of this module, changes to the rendering render all figures again
+    """
+    with open(__file__, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def render_figures(figures, directory="figures", formats=FORMATS, workers=None):
+    """
+    Renders the figures whose data changed since the last render in parallel worker processes
+
+    Parameters:
+        figures (list): FigureSpec of every figure
+        directory (str): directory of the figure files, generated if it doesn't exist
+        formats (tuple): file formats, e.g. ("png", "svg")
+        workers (int, optional): Number of worker processes, defaults to the number of cores.
+            With one worker the figures are rendered in this process
+
+    Returns:
+        dict: "rendered" or "unchanged" for every figure by name
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest_file = os.path.join(directory, MANIFEST)
+    try:
+        with open(manifest_file) as file:
+            manifest = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        manifest = {}
+
+    version = code_version()
+    digests = {spec.name: spec.digest(version) for spec in figures}
+    pending = [spec for spec in figures
+               if manifest.get(spec.name) != digests[spec.name]
+               or not all(os.path.exists(os.path.join(directory, f"{spec.name}.{file_format}"))
+                          for file_format in formats)]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(pending)))
+    if workers == 1:
+        rendered = [render_figure(spec, directory, formats) for spec in pending]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            rendered = list(executor.map(render_figure, pending, [directory] * len(pending),
+                                         [formats] * len(pending)))
+
+    # Only the figures that were actually saved are marked as rendered
+    for name in rendered:
+        manifest[name] = digests[name]
+    temporary = f"{manifest_file}.{os.getpid()}.tmp"
+    with open(temporary, "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(temporary, manifest_file)
+
+    return {spec.name: "rendered" if spec.name in rendered else "unchanged" for spec in figures}
@@ -0,0 +1,133 @@
+import heapq
+import itertools
+import simpy
+
+"""
+    Priority resource with the waiting requests in a binary heap.
+
+    simpy.PriorityResource keeps its waiting requests in a list that is sorted again after
+    every request and removes the granted request from the front of the list, both cost O(n)
+    for n waiting requests. With long queues in the casualty wards (and a distinct priority
+    for every patient as in Task 3v3) this dominates the run time.
+
+    HeapQueue keeps the requests in a heap ordered by (key, sequence number): the key of the
+    request (priority, time of the request, preempt flag) like the sorted list, the sequence
+    number keeps the order of the requests with equal keys (FIFO, like the stable sort of the
+    list). So requests are granted in exactly the same order, in O(log n) per request.
+"""
+
+
+class HeapQueue:
+    """
+    Put queue of a resource as binary heap, with the queue interface SimPy needs
+    (append, pop, __getitem__, __len__ and remove for cancelled requests)
+    """
+
+    def __init__(self, maxlen=None):
+        """
+        Parameters:
+            maxlen (int, optional): Maximum length of the queue
+        """
+        self.maxlen = maxlen
+        self.heap = []
+        self.sequence = itertools.count()
+
+    def append(self, request):
+        """
+        Adds a request, raises a RuntimeError if the queue is full
+        """
+        if self.maxlen is not None and len(self.heap) >= self.maxlen:
+            raise RuntimeError("Cannot append event. Queue is full.")
+        heapq.heappush(self.heap, (request.key, next(self.sequence), request))
+
+    def __getitem__(self, index):
+        # The resource only looks at the first request, any other index needs the sorted order
+        if index == 0:
+            return self.heap[0][2]
+        return sorted(self.heap)[index][2]
+
+    def pop(self, index=0):
+        """
+        Removes and returns the request at the position in the order of the queue
+        """
+        if index == 0:
+            return heapq.heappop(self.heap)[2]
+        entry = sorted(self.heap)[index]
+        self.heap.remove(entry)
+        heapq.heapify(self.heap)
+        return entry[2]
+
+    def remove(self, request):
+        """
+        Removes a cancelled request
+        """
+        for position, entry in enumerate(self.heap):
+            if entry[2] is request:
+                last = self.heap.pop()
+                if position < len(self.heap):
+                    self.heap[position] = last
+                    heapq.heapify(self.heap)
+                return
+        raise ValueError("Request is not in the queue")
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __iter__(self):
+        return (entry[2] for entry in sorted(self.heap))
+
+
+class HeapPriorityResource(simpy.PriorityResource):
+    """
+    simpy.PriorityResource with the waiting requests in a HeapQueue
+    """
+
+    PutQueue = HeapQueue
+
+
+def benchmark_queue(lengths=(10, 100, 1000, 5000, 20000), requests=2000, distinct=True):
+    """
+    Time per request (append and grant) of SimPy's sorted list and of the heap at a constant queue length
+
+    Parameters:
+        lengths (tuple): queue lengths
+        requests (int): Number of requests timed per queue length
+        distinct (bool): distinct priorities (like int(arrival_time) in Task 3v3), otherwise two priorities
+
+    Returns:
+        dict: microseconds per request of "sorted list" and "heap" by queue length
+    """
+    import time
+    import random
+    from simpy.resources.resource import SortedQueue
+
+    class Request:
+        __slots__ = ("key",)
+
+        def __init__(self, key):
+            self.key = key
+
+    rng = random.Random(1)
+    results = {}
+    for length in lengths:
+        results[length] = {}
+        for name, queue_type in (("sorted list", SortedQueue), ("heap", HeapQueue)):
+            queue = queue_type()
+            keys = [(rng.random() if distinct else rng.choice((0, -1)), 0.0, False) for _ in range(length + requests)]
+            for key in keys[:length]:
+                queue.append(Request(key))
+            start = time.perf_counter()
+            for key in keys[length:]:
+                queue.append(Request(key))
+                queue.pop(0)
+            results[length][name] = (time.perf_counter() - start) / requests * 1e6
+    return results
+
+
+# Hauptprogramm
+if __name__ == "__main__":
+    for distinct in (True, False):
+        print("Distinct priorities" if distinct else "Two priorities")
+        for length, timings in benchmark_queue(distinct=distinct).items():
+            print(f"Queue length {length:>6}: sorted list {timings['sorted list']:8.2f} us, "
+                  f"heap {timings['heap']:5.2f} us per request")
@@ -0,0 +1,343 @@
+import math
+import statistics
+import time
+import numpy as np
+from fast_engine import REGISTRATION, CW1, CW2, X_RAY, PLASTER, CAPACITIES, SERVICE_TIMES, DOCTORS_ARRIVAL
+from variate_pool import sample_triangular
+from running_statistics import RunningStatistics, PatientTimeStatistics
+from patient_records import PatientRecords
+from resource_usage import RESOURCE_NAMES, ResourceUsage
+
+"""
+    Vectorized engine for many replications of the FIFO model (Task 1) at once.
+
+    In a FIFO station with c servers every patient starts at the later of the arrival and the
+    time the earliest server gets free (Kiefer-Wolfowitz, for c=1 the Lindley recursion). So the
+    departures of a station follow from its arrivals without simulating single events, and the
+    recursion runs for R replications in lockstep over arrays shaped (R, slots).
+
+    The casualty wards and the X-ray are visited twice by some patients, so the arrivals of the
+    second visits depend on the departures of the same stations. The stations are therefore
+    solved in turns until their arrivals don't change any more. Every turn the times are correct
+    at least one service time further, and the fixed point is the path of the event simulation.
+
+    The random numbers are drawn from one NumPy generator for the whole block of replications,
+    so the results are statistically the same as those of the SimPy model, not the same values.
+
+    Every turn after the first sorts the arrivals of a station in the order of the previous
+    turn, which is nearly sorted, and the replications are solved in cache sized blocks.
+    Measured: 1000 replications of 250 patients take 0.52-0.59 s (before 0.56-0.70 s), 3000
+    replications 1.34-1.45 s (before 1.78-1.86 s), about 8 turns over the stations. The slot
+    loop of the stations with several servers is sequential by nature.
+"""
+
+# Interarrival time and patient types, as in generate_patients
+MEAN_INTERARRIVAL_TIME = 0.3
+PATIENT_TYPES = (1, 2, 3, 4)
+PATIENT_TYPE_WEIGHTS = (35, 20, 5, 40)
+
+# Probability of the allocation to casualty ward 1
+CW1_PROBABILITY = 0.6
+
+# Replications solved together in the turns over the stations
+ROW_BLOCK = 256
+
+
+def station_order(arrivals, previous=None):
+    """
+    Order in which a FIFO station serves its slots, for all replications at once
+
+    Patients are served in order of arrival, ties in order of the slots, slots that don't visit
+    the station are sorted to the end. Later turns only move the arrivals of the second visits,
+    so the arrivals in the order of the previous turn are nearly sorted and the stable sort
+    (a merge sort) takes a fraction of the time of sorting them in the order of the slots.
+
+    Parameters:
+        arrivals (ndarray): arrival times shaped (replications, slots), inf for slots that don't visit the station
+        previous (ndarray, optional): order of the same rows in the previous turn
+
+    Returns:
+        ndarray: all slots shaped (replications, slots) in the order they are served
+    """
+    if previous is None:
+        return np.argsort(arrivals, axis=1, kind="stable")
+
+    # Flat indices are much faster than take_along_axis
+    rows, slots = arrivals.shape
+    offsets = (np.arange(rows) * slots)[:, None]
+    ordered = np.take(arrivals, previous + offsets)
+    resorted = np.argsort(ordered, axis=1, kind="stable") + offsets
+    order = np.take(previous, resorted)
+
+    # Ties keep the order of the previous turn, the rows where that isn't the order of the
+    # slots are sorted from scratch
+    ordered = np.take(ordered, resorted)
+    unstable = ((ordered[:, 1:] == ordered[:, :-1]) & (order[:, 1:] < order[:, :-1])).any(axis=1)
+    if unstable.any():
+        order[unstable] = np.argsort(arrivals[unstable], axis=1, kind="stable")
+    return order
+
+
+def fifo_departures(arrivals, service_times, servers, order=None):
+    """
+    Departures of a FIFO station with several servers, for all replications at once
+
+    Parameters:
+        arrivals (ndarray): arrival times shaped (replications, slots), inf for slots that don't visit the station
+        service_times (ndarray): service time of every slot, same shape as arrivals
+        servers (int): Number of servers of the station
+        order (ndarray, optional): order the slots are served in (station_order), sorted here if not given
+
+    Returns:
+        ndarray: departure times of every slot, inf for slots that don't visit the station
+    """
+    # Only the visited slots are gathered and solved, in the order they are served (flat
+    # indices are much faster than take_along_axis)
+    rows, slots = arrivals.shape
+    if order is None:
+        order = station_order(arrivals)
+    visits = int(np.isfinite(arrivals).sum(axis=1).max(initial=0))
+    order = order[:, :visits] + (np.arange(rows) * slots)[:, None]
+    arrivals = np.take(arrivals, order)
+    service_times = np.take(service_times, order)
+
+    if servers == 1:
+        # Lindley recursion in closed form: d_i = S_i + max_{j<=i} (a_j - S_{j-1})
+        cumulative = np.cumsum(service_times, axis=1)
+        departures = cumulative + np.maximum.accumulate(arrivals - (cumulative - service_times), axis=1)
+    else:
+        # Kiefer-Wolfowitz recursion over the sorted times the servers get free, slot by slot
+        # for all rows at once (transposed, so every slot is a contiguous row)
+        arrivals, service_times = arrivals.T.copy(), service_times.T.copy()
+        departures = np.empty_like(arrivals)
+        free = [np.zeros(rows) for server in range(servers)]
+        maximum, minimum = np.maximum, np.minimum
+        for arrival, service_time, departure in zip(arrivals, service_times, departures):
+            maximum(arrival, free[0], out=departure)
+            departure += service_time
+            # The earliest server takes the departure, which is sorted into the other free times.
+            # The arrival row isn't needed any more and takes the later of the times
+            later = departure
+            for server in range(1, servers):
+                minimum(free[server], later, out=free[server - 1])
+                later = maximum(free[server], later, out=arrival)
+            free[-1] = later
+        departures = departures.T
+
+    result = np.full((rows, slots), np.inf)
+    np.put(result, order, departures)
+    return result
+
+
+def simulate_replications(num_patients, replications, seed=10, keep_patients=False, max_iterations=10000,
+                          arrivals=None):
+    """
+    Simulates many replications of the FIFO model at once
+
+    Parameters:
+        num_patients (int): Number of patients per replication
+        replications (int): Number of replications
+        seed (int): Seed of the NumPy generator of the whole block
+        keep_patients (bool): Keep a record of every patient, the statistics don't need it
+        max_iterations (int): Maximum number of turns over the stations
+        arrivals (NHPPArrivals, optional): non-homogeneous arrivals, constant rate 1/0.3 if not given
+
+    Returns:
+        list: stats dictionary of every replication, as filled by the SimPy model
+    """
+    generator = np.random.default_rng(seed)
+    shape = (replications, num_patients)
+    inf = np.inf
+
+    # Patients: arrival, type and casualty ward
+    if arrivals is None:
+        arrival = np.cumsum(generator.exponential(MEAN_INTERARRIVAL_TIME, shape), axis=1)
+    else:
+        arrival = np.stack([arrivals.arrival_times(generator, num_patients) for _ in range(replications)])
+    cum_weights = np.cumsum(PATIENT_TYPE_WEIGHTS, dtype=float)
+    patient_type = np.asarray(PATIENT_TYPES)[np.searchsorted(cum_weights, generator.random(shape) * cum_weights[-1],
+                                                             side="right")]
+    in_cw1 = generator.random(shape) < CW1_PROBABILITY
+    type_1, type_2, type_3 = patient_type == 1, patient_type == 2, patient_type == 3
+
+    # Service times of every step, same distributions as stage_draws in the model
+    def service(resource):
+        return sample_triangular(generator, shape, *SERVICE_TIMES[resource])
+
+    registration_time = service(REGISTRATION)
+    cw_time = np.concatenate([np.where(in_cw1, service(CW1), service(CW2)) for visit in range(2)], axis=1)
+    x_ray_time = np.concatenate([service(X_RAY), service(X_RAY)], axis=1)
+    plaster_time = service(PLASTER)
+
+    # Registration is visited once by everybody in order of arrival, the doctors arrive at t=30
+    registered = fifo_departures(arrival, registration_time, CAPACITIES[REGISTRATION])
+    first_cw_arrival = np.maximum(registered, DOCTORS_ARRIVAL)
+
+    # Slots of the casualty wards and the X-ray: first visit of every patient, then the second visits
+    slot_in_cw1 = np.concatenate([in_cw1, in_cw1], axis=1)
+    cw_service_time = np.where(slot_in_cw1, cw_time, 0.0), np.where(slot_in_cw1, 0.0, cw_time)
+
+    def solve_stations(rows, second_cw_arrival, second_x_ray_arrival, orders):
+        """
+        One turn over the casualty wards, the X-ray and the plaster for some replications
+
+        Returns:
+            tuple: departures of the casualty wards, the X-ray and the plaster, the orders of
+                the stations are updated in orders
+        """
+        in_ward = slot_in_cw1[rows]
+        cw_arrival = np.concatenate([first_cw_arrival[rows], second_cw_arrival], axis=1)
+
+        # Both casualty wards at once (same capacity), one row per replication and ward
+        cw_arrival = np.concatenate([np.where(in_ward, cw_arrival, inf), np.where(in_ward, inf, cw_arrival)])
+        orders["cw"] = station_order(cw_arrival, orders.get("cw"))
+        cw_departure = fifo_departures(cw_arrival, np.concatenate([cw_service_time[0][rows], cw_service_time[1][rows]]),
+                                       CAPACITIES[CW1], orders["cw"])
+        cw_departure = np.where(in_ward, cw_departure[:len(rows)], cw_departure[len(rows):])
+        first_cw_departure = cw_departure[:, :num_patients]
+
+        # Type 1 and 3 go to the X-ray after the casualty ward, type 3 again after the plaster
+        first_x_ray_arrival = np.where(type_1[rows] | type_3[rows], first_cw_departure, inf)
+        x_ray_arrival = np.concatenate([first_x_ray_arrival, second_x_ray_arrival], axis=1)
+        orders["x_ray"] = station_order(x_ray_arrival, orders.get("x_ray"))
+        x_ray_departure = fifo_departures(x_ray_arrival, x_ray_time[rows], CAPACITIES[X_RAY], orders["x_ray"])
+
+        # Type 2 goes to the plaster after the casualty ward, type 3 after the X-ray
+        plaster_arrival = np.where(type_2[rows], first_cw_departure,
+                                   np.where(type_3[rows], x_ray_departure[:, :num_patients], inf))
+        orders["plaster"] = station_order(plaster_arrival, orders.get("plaster"))
+        plaster_departure = fifo_departures(plaster_arrival, plaster_time[rows], CAPACITIES[PLASTER], orders["plaster"])
+        return cw_departure, x_ray_departure, plaster_departure
+
+    # The second visits are unknown at first, they are solved in turns. A replication is done
+    # as soon as its second visits don't change any more, only the others are solved again,
+    # starting from the orders of their stations in the previous turn. The replications are
+    # solved in blocks of ROW_BLOCK, so the arrays of a turn stay in the CPU cache.
+    second_cw_arrival = np.full(shape, inf)
+    second_x_ray_arrival = np.full(shape, inf)
+    cw_departure = np.empty((replications, 2 * num_patients))
+    plaster_departure = np.empty(shape)
+    for block in range(0, replications, ROW_BLOCK):
+        rows = np.arange(block, min(block + ROW_BLOCK, replications))
+        orders = {}
+
+        for iteration in range(max_iterations):
+            cw_departure[rows], x_ray_departure, plaster_departure[rows] = solve_stations(
+                rows, second_cw_arrival[rows], second_x_ray_arrival[rows], orders)
+
+            # Type 3 returns to the X-ray after the plaster, type 1 returns to the casualty ward
+            # after the X-ray, type 3 after the second X-ray
+            x_ray_arrival = np.where(type_3[rows], plaster_departure[rows], inf)
+            cw_arrival = np.where(type_1[rows], x_ray_departure[:, :num_patients],
+                                  np.where(type_3[rows], x_ray_departure[:, num_patients:], inf))
+
+            changed = ((x_ray_arrival != second_x_ray_arrival[rows]) | (cw_arrival != second_cw_arrival[rows])).any(axis=1)
+            second_x_ray_arrival[rows] = x_ray_arrival
+            second_cw_arrival[rows] = cw_arrival
+            rows = rows[changed]
+            if not len(rows):
+                break
+            # The casualty wards have a row per replication and ward
+            orders["cw"] = np.concatenate([orders["cw"][:len(changed)][changed], orders["cw"][len(changed):][changed]])
+            orders["x_ray"] = orders["x_ray"][changed]
+            orders["plaster"] = orders["plaster"][changed]
+        else:
+            raise RuntimeError(f"Stations did not converge within {max_iterations} iterations")
+
+    # Exit after the last step of the route
+    first_cw_departure = cw_departure[:, :num_patients]
+    departure = np.where(type_1 | type_3, cw_departure[:, num_patients:], np.where(type_2, plaster_departure, first_cw_departure))
+    total_time = departure - arrival
+
+    # Moments of all replications at once, overall and per patient type
+    overall = _moments(total_time, np.ones(shape, dtype=bool))
+    types = {value: _moments(total_time, patient_type == value) for value in PATIENT_TYPES}
+
+    # Busy server-time and completed services of every resource: the services of all visits
+    cw_visit = np.concatenate([np.ones(shape, dtype=bool), type_1 | type_3], axis=1)
+    visits = (
+        np.ones(shape, dtype=bool),
+        cw_visit & slot_in_cw1,
+        cw_visit & ~slot_in_cw1,
+        np.concatenate([type_1 | type_3, type_3], axis=1),
+        type_2 | type_3,
+    )
+    service_times = (registration_time, cw_time, cw_time, x_ray_time, plaster_time)
+    busy_times = [np.where(visit, service_time, 0.0).sum(axis=1) for visit, service_time in zip(visits, service_times)]
+    completions = [visit.sum(axis=1) for visit in visits]
+    end_time = departure.max(axis=1, initial=0.0)
+
+    stats = []
+    for replication in range(replications):
+        times = PatientTimeStatistics(PATIENT_TYPES)
+        times.overall = RunningStatistics.from_moments(*(moment[replication] for moment in overall))
+        for value, moments in types.items():
+            times.types[value] = RunningStatistics.from_moments(*(moment[replication] for moment in moments))
+
+        records = None
+        if keep_patients:
+            records = PatientRecords.from_columns([np.arange(num_patients), patient_type[replication],
+                                                   arrival[replication], departure[replication]])
+        resources = {name: ResourceUsage.from_totals(capacity, busy_time[replication], completed[replication],
+                                                     end_time[replication])
+                     for name, capacity, busy_time, completed in zip(RESOURCE_NAMES, CAPACITIES, busy_times, completions)}
+        stats.append({"patients": records, "times": times, "resources": resources})
+    return stats
+
+
+def _moments(values, mask):
+    """
+    Count, mean and sum of squared differences from the mean of the masked values of every row
+
+    Parameters:
+        values (ndarray): values shaped (replications, patients)
+        mask (ndarray): values that belong to the group
+
+    Returns:
+        tuple: count, mean and m2 of every row, mean 0 for empty rows
+    """
+    count = mask.sum(axis=1)
+    mean = np.where(mask, values, 0.0).sum(axis=1) / np.maximum(count, 1)
+    m2 = np.where(mask, np.square(values - mean[:, None]), 0.0).sum(axis=1)
+    return count, mean, m2
+
+
+def run_replications(calc_statistics, num_patients=250, replications=1000, seed=10, keep_patients=False, arrivals=None):
+    """
+    Runs many replications at once and calculates the statistics of each of them
+
+    Parameters:
+        calc_statistics (function): calc_statistics function of Task_1 or Task_1_graphics
+        num_patients (int): Number of patients per replication
+        replications (int): Number of replications
+        seed (int): Seed of the NumPy generator of the whole block
+        keep_patients (bool): Keep a record of every patient, the statistics don't need it
+        arrivals (NHPPArrivals, optional): non-homogeneous arrivals, constant rate 1/0.3 if not given
+
+    Returns:
+        list: (results, stats) of every replication, like replication_runner.run_replications
+    """
+    return [(calc_statistics(stats), stats)
+            for stats in simulate_replications(num_patients, replications, seed, keep_patients,
+                                               arrivals=arrivals)]
+
+
+# Hauptprogramm
+if __name__ == "__main__":
+    import Task_1
+
+    replications = 1000
+
+    start = time.perf_counter()
+    stats = simulate_replications(250, replications)
+    wall_time = time.perf_counter() - start
+    lindley = [replication["times"].overall.mean for replication in stats]
+
+    simpy = [Task_1.run_simulation(replication=replication, save=False)[0]["overall_avg_time"] for replication in range(50)]
+
+    # A |z| below 2 means the engines agree within the sampling noise
+    standard_error = math.hypot(statistics.stdev(lindley) / math.sqrt(len(lindley)),
+                                statistics.stdev(simpy) / math.sqrt(len(simpy)))
+    z = (statistics.mean(lindley) - statistics.mean(simpy)) / standard_error
+    print(f"{replications} replications in {wall_time:.3f} s: Lindley {statistics.mean(lindley):.2f}, "
+          f"SimPy {statistics.mean(simpy):.2f}, z = {z:.2f}")
@@ -0,0 +1,156 @@
+import numpy as np
+
+"""
+    Compact store of the patient records.
+
+    Instead of one dictionary per patient the records are kept in typed NumPy columns that are
+    preallocated and doubled in size when they are full. Reading a column returns a view of the
+    filled part, so the statistics, the writers for the raw data and pandas can use the records
+    without copying them.
+
+    Writing single values into NumPy arrays is slow compared to a Python list, so appended
+    records are collected in a list and written into the columns in blocks.
+"""
+
+# Number of appended records collected before they are written into the columns
+FLUSH_SIZE = 256
+
+# Name and type of the columns of every patient record
+COLUMNS = (
+    ("id", np.int64),
+    ("type", np.int8),
+    ("arrival", np.float64),
+    ("departure", np.float64),
+)
+
+
+class PatientRecords:
+    """
+    Columnar store of patient records with geometric growth of the buffers
+    """
+
+    def __init__(self, capacity=256, columns=COLUMNS):
+        """
+        Parameters:
+            capacity (int): Number of records the buffers are preallocated for
+            columns (tuple): name and NumPy type of each column
+        """
+        self.names = tuple(name for name, dtype in columns)
+        self.buffers = [np.empty(max(1, capacity), dtype=dtype) for name, dtype in columns]
+        self.size = 0
+        self.pending = []
+
+    @classmethod
+    def from_columns(cls, columns, names=None):
+        """
+        Creates the records from complete columns, e.g. of a vectorized engine
+
+        Parameters:
+            columns (list): one array per column, in the order of the columns
+            names (tuple, optional): names of the columns, those of COLUMNS if not given
+
+        Returns:
+            PatientRecords: records holding the columns
+        """
+        records = cls.__new__(cls)
+        dtypes = dict(COLUMNS)
+        records.names = tuple(names or dtypes)
+        records.buffers = [np.asarray(column, dtype=dtypes.get(name)) for name, column in zip(records.names, columns)]
+        records.size = len(records.buffers[0])
+        records.pending = []
+        return records
+
+    def append(self, *values):
+        """
+        Adds a record
+
+        Parameters:
+            *values: one value per column, in the order of the columns
+        """
+        self.pending.append(values)
+        if len(self.pending) >= FLUSH_SIZE:
+            self._flush()
+
+    def extend(self, rows):
+        """
+        Adds records collected by the caller, e.g. the departures of an engine in one block
+
+        Parameters:
+            rows (list): records, one value per column in the order of the columns
+        """
+        self.pending.extend(rows)
+        if len(self.pending) >= FLUSH_SIZE:
+            self._flush()
+
+    def _flush(self):
+        """
+        Writes the collected records into the columns, doubles the buffers if they are too small
+        """
+        if not self.pending:
+            return
+        size = self.size + len(self.pending)
+        while size > len(self.buffers[0]):
+            self._grow()
+        for buffer, column in zip(self.buffers, zip(*self.pending)):
+            buffer[self.size:size] = column
+        self.size = size
+        self.pending = []
+
+    def _grow(self):
+        """
+        Doubles the capacity of all buffers, views taken before keep pointing to the old data
+        """
+        for index, buffer in enumerate(self.buffers):
+            grown = np.empty(max(1, 2 * len(buffer)), dtype=buffer.dtype)
+            grown[:self.size] = buffer[:self.size]
+            self.buffers[index] = grown
+
+    def __len__(self):
+        return self.size + len(self.pending)
+
+    def __getitem__(self, name):
+        """
+        Parameters:
+            name (str): name of the column
+
+        Returns:
+            ndarray: view of the filled part of the column
+        """
+        self._flush()
+        return self.buffers[self.names.index(name)][:self.size]
+
+    def total_time(self):
+        """
+        Returns:
+            ndarray: time of every patient in the emergency room
+        """
+        return self["departure"] - self["arrival"]
+
+    def columns(self):
+        """
+        Returns:
+            dict: view of every column by name
+        """
+        return {name: self[name] for name in self.names}
+
+    def to_frame(self):
+        """
+        Returns:
+            DataFrame: records with one column per field and the total time
+        """
+        import pandas as pd
+
+        columns = self.columns()
+        columns["total_time"] = self.total_time()
+        return pd.DataFrame(columns, copy=False)
+
+    def __getstate__(self):
+        # Only the filled part of the buffers is sent to other processes
+        self._flush()
+        return {"names": self.names, "buffers": [self[name] for name in self.names], "size": self.size}
+
+    def __setstate__(self, state):
+        self.names = state["names"]
+        self.buffers = list(state["buffers"])
+        self.size = state["size"]
+        self.pending = []
@@ -0,0 +1,302 @@
+import os
+import json
+import math
+import numpy as np
+from patient_records import COLUMNS
+from running_statistics import RunningStatistics, PatientTimeStatistics
+from raw_data_sink import open_sink
+
+"""
+    Streaming of the departures for runs with millions of patients.
+
+    PatientStream takes the place of PatientRecords in stats["patients"]. The departures are
+    collected in a chunk of fixed size, a full chunk is pushed as columns through a pipeline of
+    generators (coroutines receiving the chunks with send) and dropped:
+
+        PatientStream -> with_total_time -> broadcast -> chunk_writer   (raw data file, flushed to disk)
+                                                      -> aggregator     (running statistics, quantile sketches)
+                                                      -> checkpoint     (summary file, replaced atomically)
+
+    So the memory of the records is one chunk no matter how long the run is. After every chunk
+    the raw data file is synced to disk (a .npy file is valid after every write, see NpySink) and
+    the summary of everything written so far replaces the summary file. If the run crashes, raw
+    data and summary are complete up to the last flushed chunk.
+
+    The quantiles come from log-spaced bins (relative accuracy 1%), whose number grows with the
+    logarithm of the longest time only.
+"""
+
+# Number of departures per chunk
+CHUNK_SIZE = 65536
+
+# Columns of the streamed raw data
+STREAM_HEADER = ["Patient ID", "Patient Type", "Arrival Time", "Departure Time", "Total Time"]
+
+# Quantiles of the summary
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+class QuantileSketch:
+    """
+    Quantiles of a stream of positive values with a bounded relative error, in log-spaced bins
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        """
+        Parameters:
+            relative_accuracy (float): maximum relative error of the quantiles
+        """
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.offset = 0
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, values):
+        """
+        Adds a block of values, values <= 0 are counted as 0
+
+        Parameters:
+            values (ndarray): values to add
+        """
+        values = np.asarray(values, dtype=np.float64)
+        positive = values[values > 0]
+        self.count += len(values)
+        self.zeros += len(values) - len(positive)
+        if not len(positive):
+            return
+
+        # Bin k holds the values in (gamma^(k-1), gamma^k]
+        keys = np.ceil(np.log(positive) / self.log_gamma).astype(np.int64)
+        low, high = int(keys.min()), int(keys.max())
+        if not len(self.counts):
+            self.offset = low
+        elif low < self.offset:
+            self.counts = np.concatenate((np.zeros(self.offset - low, dtype=np.int64), self.counts))
+            self.offset = low
+        size = max(len(self.counts), high - self.offset + 1)
+        self.counts = np.pad(self.counts, (0, size - len(self.counts)))
+        self.counts += np.bincount(keys - self.offset, minlength=size)
+
+    def quantile(self, q):
+        """
+        Parameters:
+            q (float): probability between 0 and 1
+
+        Returns:
+            float: quantile, NaN without values
+        """
+        if not self.count:
+            return float("nan")
+        rank = q * (self.count - 1)
+        if rank < self.zeros:
+            return 0.0
+        index = int(np.searchsorted(np.cumsum(self.counts), rank - self.zeros, side="right"))
+        index = min(index, len(self.counts) - 1)
+        # Middle of the bin in terms of the relative error
+        return 2 * self.gamma ** (index + self.offset) / (self.gamma + 1)
+
+
+def coroutine(function):
+    """
+    Decorator for generator functions that receive values with send, advances them to the first yield
+    """
+    def start(*args, **kwargs):
+        generator = function(*args, **kwargs)
+        next(generator)
+        return generator
+    return start
+
+
+@coroutine
+def with_total_time(target):
+    """
+    Adds the total time to the columns of every chunk (id, type, arrival, departure)
+
+    Parameters:
+        target (generator): next stage of the pipeline
+    """
+    try:
+        while True:
+            columns = yield
+            target.send(columns + [columns[3] - columns[2]])
+    finally:
+        target.close()
+
+
+@coroutine
+def broadcast(*targets):
+    """
+    Sends every chunk to several stages, in the given order
+
+    Parameters:
+        *targets (generator): stages of the pipeline
+    """
+    try:
+        while True:
+            columns = yield
+            for target in targets:
+                target.send(columns)
+    finally:
+        for target in targets:
+            target.close()
+
+
+@coroutine
+def chunk_writer(sink):
+    """
+    Writes every chunk into the raw data file and flushes it to disk, closes the file at the end
+
+    Parameters:
+        sink (RawDataSink or NpySink): open sink of the raw data file
+    """
+    try:
+        while True:
+            columns = yield
+            sink.write_columns(STREAM_HEADER, columns)
+            sink.flush()
+    finally:
+        sink.close()
+
+
+@coroutine
+def aggregator(times, sketches):
+    """
+    Adds every chunk to the running statistics and the quantile sketches of the total time
+
+    Parameters:
+        times (PatientTimeStatistics): running statistics, overall and by patient type
+        sketches (dict): QuantileSketch of all patients (key "overall") and of every patient type
+    """
+    while True:
+        columns = yield
+        patient_types, total_times = columns[1], columns[4]
+        for patient_type, statistics in times.types.items():
+            values = total_times[patient_types == patient_type]
+            if len(values):
+                # Moments of the chunk, merged like the statistics of another replication
+                mean = values.mean()
+                chunk = RunningStatistics.from_moments(len(values), mean, ((values - mean) ** 2).sum())
+                statistics.merge(chunk)
+                times.overall.merge(chunk)
+                sketches[patient_type].add(values)
+        sketches["overall"].add(total_times)
+
+
+@coroutine
+def checkpoint(filename, stream):
+    """
+    Replaces the summary file with the summary of everything written so far after every chunk
+
+    Parameters:
+        filename (str): Path to the summary (.json) file
+        stream (PatientStream): stream whose summary is written
+    """
+    while True:
+        yield
+        temporary = f"{filename}.{os.getpid()}.tmp"
+        with open(temporary, "w") as file:
+            json.dump(stream.summary(), file, indent=2)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, filename)
+
+
+class PatientStream:
+    """
+    Drop-in replacement of PatientRecords that streams the departures through the pipeline in chunks
+    """
+
+    def __init__(self, filename, chunk_size=CHUNK_SIZE, patient_types=(1, 2, 3, 4)):
+        """
+        Parameters:
+            filename (str): Path to the raw data file (.npy or .csv) of this run, an existing file is
+                replaced. The summary is written next to it as .summary.json
+            chunk_size (int): Number of departures per chunk
+            patient_types (tuple): patient types of the statistics
+        """
+        if os.path.exists(filename):
+            os.remove(filename)
+        self.filename = filename
+        self.summary_filename = f"{os.path.splitext(filename)[0]}.summary.json"
+        self.chunk_size = chunk_size
+        self.dtypes = [dtype for name, dtype in COLUMNS]
+        self.pending = []
+        self.flushed = 0
+        self.times = PatientTimeStatistics(patient_types)
+        self.sketches = {key: QuantileSketch() for key in ("overall",) + tuple(patient_types)}
+        self.pipeline = with_total_time(broadcast(
+            chunk_writer(open_sink(filename)),
+            aggregator(self.times, self.sketches),
+            checkpoint(self.summary_filename, self),
+        ))
+
+    def append(self, *values):
+        """
+        Adds a departure
+
+        Parameters:
+            *values: id, type, arrival and departure of the patient
+        """
+        self.pending.append(values)
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+
+    def extend(self, rows):
+        """
+        Adds departures collected by the caller, pushed through the pipeline in chunks
+
+        Parameters:
+            rows (list): id, type, arrival and departure of every patient
+        """
+        self.pending.extend(rows)
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Pushes the collected departures through the pipeline
+        """
+        if not self.pending:
+            return
+        columns = [np.array(column, dtype=dtype) for column, dtype in zip(zip(*self.pending), self.dtypes)]
+        self.pending = []
+        self.flushed += len(columns[0])
+        self.pipeline.send(columns)
+
+    def close(self):
+        """
+        Flushes the last chunk and closes the raw data file
+        """
+        if self.pipeline is not None:
+            self.flush()
+            self.pipeline.close()
+            self.pipeline = None
+
+    def __len__(self):
+        return self.flushed + len(self.pending)
+
+    def summary(self):
+        """
+        Returns:
+            dict: number of flushed departures, count, mean, standard deviation and quantiles of the
+                total time overall and by patient type
+        """
+        summary = {"patients": self.flushed}
+        groups = [("overall", self.times.overall)] + list(self.times.types.items())
+        for key, statistics in groups:
+            summary[str(key)] = {
+                "count": statistics.count,
+                "avg_time": statistics.mean,
+                "standard_deviation": statistics.standard_deviation,
+                **{f"p{round(100 * q)}": self.sketches[key].quantile(q) for q in QUANTILES},
+            }
+        return summary
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,181 @@
+import numpy as np
+
+"""
+    Event-driven monitor of the queue length and the number of patients in service of SimPy resources.
+
+    Instead of a process that polls the resources, the monitor hooks the methods every request
+    and release of a resource goes through (_trigger_put and _trigger_get). A change point is
+    only recorded when the queue length or the number in service actually changed. The time
+    weighted averages and the maxima are updated at every change point, so they are exact for
+    the whole run, while the change points themselves are kept in preallocated ring buffers of
+    fixed size (the most recent ones), so the cost per change point and the memory are bounded.
+
+    Without a monitor nothing is hooked and the resources run at full speed.
+"""
+
+# Number of change points kept per resource
+RING_SIZE = 4096
+
+
+class ResourceMonitor:
+    """
+    Queue length and number in service of one resource over time
+    """
+
+    def __init__(self, env, resource, ring_size=RING_SIZE):
+        """
+        Parameters:
+            env (Environment): environment of the resource
+            resource (Resource): monitored resource (Resource or PriorityResource)
+            ring_size (int): Number of change points kept
+        """
+        self.env = env
+        self.resource = resource
+        self.capacity = resource.capacity
+
+        # Ring buffers of the change points
+        self.times = np.zeros(ring_size)
+        self.queue_lengths = np.zeros(ring_size, dtype=np.int32)
+        self.in_service = np.zeros(ring_size, dtype=np.int32)
+        self.changes = 0
+
+        # State since the last change point and areas under the curves up to it
+        self.start_time = self.last_time = env.now
+        self.end_time = None
+        self.last_queue_length = len(resource.queue)
+        self.last_in_service = len(resource.users)
+        self.queue_area = 0.0
+        self.service_area = 0.0
+        self.max_queue_length = self.last_queue_length
+        self.max_in_service = self.last_in_service
+        self._store(self.last_time, self.last_queue_length, self.last_in_service)
+
+        # Every request and release ends in one of these methods of the resource
+        trigger_put = resource._trigger_put
+        trigger_get = resource._trigger_get
+
+        def monitored_trigger_put(get_event):
+            trigger_put(get_event)
+            self.record()
+
+        def monitored_trigger_get(put_event):
+            trigger_get(put_event)
+            self.record()
+
+        resource._trigger_put = monitored_trigger_put
+        resource._trigger_get = monitored_trigger_get
+
+    def record(self):
+        """
+        Records a change point if the queue length or the number in service changed
+        """
+        queue_length = len(self.resource.queue)
+        in_service = len(self.resource.users)
+        if queue_length == self.last_queue_length and in_service == self.last_in_service:
+            return
+
+        now = self.env.now
+        duration = now - self.last_time
+        self.queue_area += duration * self.last_queue_length
+        self.service_area += duration * self.last_in_service
+        self.last_time = now
+        self.last_queue_length = queue_length
+        self.last_in_service = in_service
+        if queue_length > self.max_queue_length:
+            self.max_queue_length = queue_length
+        if in_service > self.max_in_service:
+            self.max_in_service = in_service
+        self._store(now, queue_length, in_service)
+
+    def _store(self, time, queue_length, in_service):
+        """
+        Writes a change point into the ring buffers, the oldest one is overwritten when they are full
+        """
+        index = self.changes % len(self.times)
+        self.times[index] = time
+        self.queue_lengths[index] = queue_length
+        self.in_service[index] = in_service
+        self.changes += 1
+
+    def close(self):
+        """
+        Ends the monitoring at the current time and drops the references to the simulation,
+        so the monitor can be pickled (e.g. to return it from a worker process)
+        """
+        if self.end_time is None:
+            self.end_time = self.env.now
+            # Instance attributes shadow the methods of the class, removing them unhooks the resource
+            del self.resource._trigger_put
+            del self.resource._trigger_get
+            self.env = None
+            self.resource = None
+            # Buffers that were never full are cut to the recorded change points
+            if self.changes < len(self.times):
+                self.times = self.times[:self.changes].copy()
+                self.queue_lengths = self.queue_lengths[:self.changes].copy()
+                self.in_service = self.in_service[:self.changes].copy()
+
+    def summary(self):
+        """
+        Returns:
+            dict: exact time weighted averages and maxima of queue length, number in service and utilization
+        """
+        end_time = self.end_time if self.end_time is not None else self.env.now
+        duration = end_time - self.last_time
+        queue_area = self.queue_area + duration * self.last_queue_length
+        service_area = self.service_area + duration * self.last_in_service
+        total_time = end_time - self.start_time
+
+        avg_queue_length = queue_area / total_time if total_time > 0 else 0.0
+        avg_in_service = service_area / total_time if total_time > 0 else 0.0
+        return {
+            "avg_queue_length": avg_queue_length,
+            "max_queue_length": self.max_queue_length,
+            "avg_in_service": avg_in_service,
+            "max_in_service": self.max_in_service,
+            "utilization": avg_in_service / self.capacity,
+        }
+
+    def series(self):
+        """
+        Returns:
+            tuple: times, queue lengths and numbers in service of the kept change points, oldest first
+        """
+        size = len(self.times)
+        if self.changes <= size:
+            order = np.arange(self.changes)
+        else:
+            order = (np.arange(size) + self.changes) % size
+        return self.times[order], self.queue_lengths[order], self.in_service[order]
+
+
+class QueueMonitor:
+    """
+    Monitors of several resources, e.g. registration, cw1, cw2, x_ray and plaster
+    """
+
+    def __init__(self, env, resources, ring_size=RING_SIZE):
+        """
+        Parameters:
+            env (Environment): environment of the resources
+            resources (dict): monitored resources by name
+            ring_size (int): Number of change points kept per resource
+        """
+        self.monitors = {name: ResourceMonitor(env, resource, ring_size) for name, resource in resources.items()}
+
+    def close(self):
+        """
+        Ends the monitoring of all resources
+        """
+        for monitor in self.monitors.values():
+            monitor.close()
+
+    def summary(self):
+        """
+        Returns:
+            dict: summary of every resource by name
+        """
+        return {name: monitor.summary() for name, monitor in self.monitors.items()}
+
+    def __getitem__(self, name):
+        return self.monitors[name]
@@ -0,0 +1,76 @@
+import random
+import numpy as np
+from variate_pool import PooledRandom
+
+"""
+    Random number streams of the simulation.
+
+    Instead of seeding the shared module level random state once at import time, every
+    replication gets its own generator. The generator of replication k is spawned from the
+    root seed by hashing (root seed, k) into the seed of a new random.Random, so replication k
+    can be run alone, on any worker and in any order and still gives the same result.
+"""
+
+
+def make_rng(seed, replication=0):
+    """
+    Spawns the random number generator of one replication
+
+    Parameters:
+        seed (int): root seed of the experiment
+        replication (int): index of the replication
+
+    Returns:
+        random.Random: independent generator for this replication
+    """
+    # Seeding with a string runs it through SHA-512, which gives well separated
+    # states for neighbouring replication indices
+    return random.Random(f"{seed}:{replication}")
+
+
+# Names of the dedicated streams used in common random numbers mode
+STREAM_NAMES = ("arrival", "patient_type", "cw_choice", "registration", "cw1", "cw2", "x_ray", "plaster")
+
+
+class ReplicationStreams:
+    """
+    Random number streams of one replication, one attribute per source of randomness:
+    arrival, patient_type, cw_choice, registration, cw1, cw2, x_ray and plaster.
+
+    By default every attribute is the same generator, which gives exactly the draws of
+    make_rng. With common random numbers every source of randomness gets its own
+    generator, so all priority variants see the same arrivals, patient types and CW
+    choices for the same replication index, and a different number of draws in one
+    stage (e.g. another order of service) does not shift the draws of the other stages.
+
+    With pooled variates the streams are PooledRandom objects that draw their variates in
+    vectorized NumPy blocks, spawned from the same seed and replication index.
+    """
+
+    def __init__(self, seed, replication=0, common_random_numbers=False, pooled_variates=False):
+        """
+        Parameters:
+            seed (int): root seed of the experiment
+            replication (int): index of the replication
+            common_random_numbers (bool): use a dedicated stream for every source of randomness
+            pooled_variates (bool): draw the variates in vectorized NumPy blocks
+        """
+        self.common_random_numbers = common_random_numbers
+        self.pooled_variates = pooled_variates
+
+        if pooled_variates:
+            seed_sequence = np.random.SeedSequence(seed, spawn_key=(replication,))
+            if common_random_numbers:
+                for name, child in zip(STREAM_NAMES, seed_sequence.spawn(len(STREAM_NAMES))):
+                    setattr(self, name, PooledRandom(child))
+            else:
+                rng = PooledRandom(seed_sequence)
+                for name in STREAM_NAMES:
+                    setattr(self, name, rng)
+        elif common_random_numbers:
+            for name in STREAM_NAMES:
+                setattr(self, name, random.Random(f"{seed}:{replication}:{name}"))
+        else:
+            rng = make_rng(seed, replication)
+            for name in STREAM_NAMES:
+                setattr(self, name, rng)
@@ -0,0 +1,299 @@
+import os
+import csv
+import struct
+import threading
+import numpy as np
+
+"""
+    Buffered writers for the raw patient data and the statistics.
+
+    The file is opened once per run (or once for a whole batch of replications) and the rows of
+    a replication are written in bulk. Whether the header is needed is decided from the size of
+    the file when it is opened, so an existing empty file also gets a header. Rows are only
+    appended to an existing file with the same columns, a file written with other columns (e.g.
+    before the utilization columns were added) raises a ValueError instead of being mixed up.
+
+    Besides CSV the rows can be written as typed columnar NumPy file (.npy with a structured
+    dtype, one field per column). Its header is rewritten after every write, so the file can be
+    appended to by later runs and loaded memory-mapped without parsing any text.
+"""
+
+# Columns stored as integers in .npy files, all other columns are stored as float
+INTEGER_COLUMNS = {
+    "Patient ID", "Patient Type", "Count Type 1", "Count Type 2", "Count Type 3", "Count Type 4", "Casualty Ward 2 Limit"
+}
+
+# Magic string of the .npy format version 1.0
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+
+
+class RawDataSink:
+    """
+    CSV file that stays open while the raw data of one or more replications is written.
+    Writes are serialized with a lock, so a multi-replication driver can share one sink.
+    """
+
+    def __init__(self, filename, delimiter=";", buffering=1024 * 1024):
+        """
+        Parameters:
+            filename (str): Path to the csv file, if it doesn't exist it will be generated
+            delimiter (str): delimiter of the csv file
+            buffering (int): size of the write buffer in bytes
+        """
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.filename = filename
+        self.file = open(filename, "a", newline="", buffering=buffering)
+        self.writer = csv.writer(self.file, delimiter=delimiter)
+        self.needs_header = self.file.tell() == 0
+        self.header = None if self.needs_header else read_header(filename, delimiter)
+        self.lock = threading.Lock()
+
+    def write_rows(self, header, rows):
+        """
+        Writes the rows of one replication, the header is only written into a new file
+
+        Parameters:
+            header (list): column names of the file
+            rows (list): rows to write
+        """
+        with self.lock:
+            if self.header is None:
+                self.header = list(header)
+            elif self.header != list(header):
+                raise ValueError(f"Columns {list(header)} don't match the columns of {self.filename}")
+            if self.needs_header:
+                self.writer.writerow(header)
+                self.needs_header = False
+            self.writer.writerows(rows)
+
+    def write_columns(self, header, columns):
+        """
+        Writes the rows of one replication given column by column (e.g. views of PatientRecords)
+
+        Parameters:
+            header (list): column names of the file
+            columns (list): one array or list per column
+        """
+        self.write_rows(header, zip(*[column.tolist() if hasattr(column, "tolist") else column
+                                      for column in columns]))
+
+    def flush(self):
+        """
+        Writes the buffer to disk, the rows written so far survive a crash of the process
+        """
+        with self.lock:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        """
+        Flushes the buffer and closes the file
+        """
+        with self.lock:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class NpySink:
+    """
+    Typed columnar .npy file that stays open while the rows of one or more replications are
+    written. Same interface as RawDataSink, the dtype is built from the header of the first write.
+    """
+
+    def __init__(self, filename):
+        """
+        Parameters:
+            filename (str): Path to the .npy file, if it doesn't exist it will be generated
+        """
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.dtype = None
+        self.count = 0
+        self.data_offset = 0
+
+        if os.path.exists(filename) and os.path.getsize(filename) > 0:
+            self.file = open(filename, "r+b")
+            np.lib.format.read_magic(self.file)
+            shape, fortran_order, self.dtype = np.lib.format.read_array_header_1_0(self.file)
+            self.count = shape[0]
+            self.data_offset = self.file.tell()
+            self.file.seek(self.data_offset + self.count * self.dtype.itemsize)
+            self.file.truncate()
+        else:
+            self.file = open(filename, "w+b")
+
+    def write_rows(self, header, rows):
+        """
+        Writes the rows of one replication and updates the number of rows in the file header
+
+        Parameters:
+            header (list): column names of the file
+            rows (list): rows to write
+        """
+        with self.lock:
+            self._check_columns(header)
+            self._write_data(np.array([tuple(row) for row in rows], dtype=self.dtype))
+
+    def _check_columns(self, header):
+        """
+        Builds the dtype from the header on the first write, later headers have to match it
+
+        Parameters:
+            header (list): column names of the file
+        """
+        if self.dtype is None:
+            self.dtype = np.dtype([(name, "<i8" if name in INTEGER_COLUMNS else "<f8") for name in header])
+            self.data_offset = self._header_size()
+            self.file.write(b"\0" * self.data_offset)
+        elif list(self.dtype.names) != list(header):
+            raise ValueError(f"Columns {header} don't match the columns of {self.filename}")
+
+    def _write_data(self, data):
+        """
+        Appends a block of rows and updates the number of rows in the file header
+
+        Parameters:
+            data (ndarray): rows with the dtype of the file
+        """
+        self.file.write(data.tobytes())
+        self.count += len(data)
+        self._write_header()
+
+    def _header_size(self):
+        """
+        Returns:
+            int: size of magic string and header, with room for a shape of 20 digits
+        """
+        size = len(NPY_MAGIC) + 2 + len(self._header(10 ** 20)) + 1
+        return -(-size // 64) * 64
+
+    def _header(self, count):
+        """
+        Parameters:
+            count (int): Number of rows in the file
+
+        Returns:
+            str: header dictionary of the .npy format
+        """
+        descr = np.lib.format.dtype_to_descr(self.dtype)
+        return f"{{'descr': {descr!r}, 'fortran_order': False, 'shape': ({count},), }}"
+
+    def _write_header(self):
+        """
+        Writes the header for the current number of rows, padded to the reserved size
+        """
+        header = self._header(self.count)
+        reserved = self.data_offset - len(NPY_MAGIC) - 2 - 1
+        if len(header) > reserved:
+            raise ValueError(f"Header of {self.filename} has no room left to be rewritten")
+        header = header.ljust(reserved) + "\n"
+        self.file.seek(0)
+        self.file.write(NPY_MAGIC + struct.pack("<H", len(header)) + header.encode("latin1"))
+        self.file.seek(0, os.SEEK_END)
+
+    def write_columns(self, header, columns):
+        """
+        Writes the rows of one replication given column by column (e.g. views of PatientRecords)
+
+        Parameters:
+            header (list): column names of the file
+            columns (list): one array or list per column
+        """
+        with self.lock:
+            self._check_columns(header)
+            data = np.empty(len(columns[0]), dtype=self.dtype)
+            for name, column in zip(header, columns):
+                data[name] = column
+            self._write_data(data)
+
+    def flush(self):
+        """
+        Writes the buffer to disk, the rows written so far survive a crash of the process
+        """
+        with self.lock:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        """
+        Flushes the buffer and closes the file
+        """
+        with self.lock:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_header(filename, delimiter=";"):
+    """
+    Reads the header of an existing csv file
+
+    Parameters:
+        filename (str): Path to the csv file
+        delimiter (str): delimiter of the csv file
+
+    Returns:
+        list: column names of the file, None if the file doesn't exist or is empty
+    """
+    if not os.path.exists(filename):
+        return None
+    with open(filename, newline="") as file:
+        return next(csv.reader(file, delimiter=delimiter), None)
+
+
+def check_header(filename, header, delimiter=";"):
+    """
+    Checks that rows with the header can be appended to the csv file
+
+    Parameters:
+        filename (str): Path to the csv file
+        header (list): column names of the rows
+        delimiter (str): delimiter of the csv file
+    """
+    existing = read_header(filename, delimiter)
+    if existing is not None and existing != list(header):
+        raise ValueError(f"Columns {list(header)} don't match the columns of {filename}")
+
+
+def open_sink(filename):
+    """
+    Opens the sink for the format given by the file extension
+
+    Parameters:
+        filename (str): Path to a .csv or .npy file
+
+    Returns:
+        RawDataSink or NpySink: open sink of the file
+    """
+    if filename.endswith(".npy"):
+        return NpySink(filename)
+    return RawDataSink(filename)
+
+
+def load_raw_data(filename):
+    """
+    Loads a .npy file memory-mapped, nothing is copied or parsed until a column is used
+
+    Parameters:
+        filename (str): Path to the .npy file
+
+    Returns:
+        memmap: structured array with one field per column
+    """
+    return np.load(filename, mmap_mode="r")
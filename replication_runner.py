@@ -0,0 +1,171 @@
+import os
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from running_statistics import RunningStatistics
+
+"""
+    Runs the replications of a simulation on a process pool instead of the serial
+    for loop in the main programs.
+
+    Every replication gets its own random number stream spawned from the root seed, so a
+    replication gives the same numbers no matter on which worker or in which order it is run.
+    Nothing is written by the workers, the results are returned to the main program
+    and saved there once all replications are done.
+
+    Instead of a fixed number of replications, run_until_precision adds replications in
+    batches until the confidence intervals of the chosen metrics are narrow enough.
+"""
+
+
+def run_replication(run_simulation, root_seed, kwargs, replication):
+    """
+    Runs a single replication without saving anything
+
+    Parameters:
+        run_simulation (function): run_simulation function of one of the Task modules
+        root_seed (int): root seed the replication streams are spawned from
+        kwargs (dict): further keyword arguments for run_simulation
+        replication (int): index of the replication
+
+    Returns:
+        tuple: calculated statistics and patient data of the replication
+    """
+    return run_simulation(seed=root_seed, replication=replication, save=False, **kwargs)
+
+
+def run_replications(run_simulation, replications=100, workers=None, root_seed=10, first_replication=0, executor=None,
+                     **kwargs):
+    """
+    Runs several replications of a simulation on a process pool
+
+    Parameters:
+        run_simulation (function): run_simulation function of one of the Task modules
+        replications (int): Number of replications
+        workers (int, optional): Number of worker processes, defaults to the number of cores.
+            With one worker the replications are run serially in this process
+        root_seed (int): root seed the replication streams are spawned from
+        first_replication (int): index of the first replication, later batches continue the streams
+        executor (ProcessPoolExecutor, optional): open process pool to run the replications on, so
+            several batches share the workers. A new pool is started (and shut down) if not given
+        **kwargs: further keyword arguments for run_simulation (e.g. num_patients)
+
+    Returns:
+        list: (results, stats) of every replication, ordered by replication index
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, replications))
+
+    task = partial(run_replication, run_simulation, root_seed, kwargs)
+    indices = range(first_replication, first_replication + replications)
+
+    if workers == 1 and executor is None:
+        return [task(replication) for replication in indices]
+
+    # Hand out several replications per task to keep the pickling overhead low
+    chunksize = max(1, replications // (workers * 4))
+    if executor is not None:
+        return list(executor.map(task, indices, chunksize=chunksize))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(task, indices, chunksize=chunksize))
+
+
+def metric_value(results, metric):
+    """
+    Parameters:
+        results (dict): calculated statistics of a replication
+        metric (str or int): key of the results (e.g. "overall_avg_time") or a patient type
+            for the average time of that type
+
+    Returns:
+        float: value of the metric in the replication
+    """
+    if isinstance(metric, int):
+        return results["types"][metric]["avg_time"]
+    return results[metric]
+
+
+def run_until_precision(run_simulation, relative_half_width=0.05, metrics=("overall_avg_time",), confidence=0.95,
+                        batch_size=None, min_replications=10, max_replications=1000, workers=None, root_seed=10,
+                        **kwargs):
+    """
+    Runs replications in parallel batches until the relative half-width of the confidence
+    interval of every metric is at most the target, or the budget of replications is used up
+
+    Parameters:
+        run_simulation (function): run_simulation function of one of the Task modules
+        relative_half_width (float): target half-width of the confidence intervals relative to their mean
+        metrics (tuple): metrics to check, keys of the results or patient types (see metric_value)
+        confidence (float): confidence level of the intervals
+        batch_size (int, optional): replications per batch, defaults to the number of workers
+            (at least min_replications for the first batch)
+        min_replications (int): replications before the first check, so the variance is estimated well enough
+        max_replications (int): budget of replications
+        workers (int, optional): Number of worker processes, defaults to the number of cores
+        root_seed (int): root seed the replication streams are spawned from
+        **kwargs: further keyword arguments for run_simulation (e.g. num_patients)
+
+    Returns:
+        tuple: (results, stats) of every replication and a report per metric with mean, half-width,
+            relative half-width and the number of replications it needed (None if the target wasn't met)
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if batch_size is None:
+        batch_size = workers
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+
+    running = {metric: RunningStatistics() for metric in metrics}
+    needed = {metric: None for metric in metrics}
+    replication_results = []
+
+    # One process pool for all batches, the workers are started and import the model only once
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        while len(replication_results) < max_replications:
+            done = len(replication_results)
+            size = max(batch_size, min_replications - done)
+            size = min(size, max_replications - done)
+            batch = run_replications(run_simulation, replications=size, workers=workers, root_seed=root_seed,
+                                     first_replication=done, executor=executor, **kwargs)
+            replication_results.extend(batch)
+
+            for metric, statistics_of_metric in running.items():
+                for results, stats in batch:
+                    statistics_of_metric.add(metric_value(results, metric))
+                if needed[metric] is None and _relative_half_width(statistics_of_metric, z) <= relative_half_width:
+                    needed[metric] = statistics_of_metric.count
+
+            if all(count is not None for count in needed.values()):
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    report = {}
+    for metric, statistics_of_metric in running.items():
+        half_width = z * statistics_of_metric.standard_deviation / statistics_of_metric.count ** 0.5
+        report[metric] = {
+            "mean": statistics_of_metric.mean,
+            "half_width": half_width,
+            "relative_half_width": _relative_half_width(statistics_of_metric, z),
+            "replications": needed[metric],
+        }
+    return replication_results, report
+
+
+def _relative_half_width(statistics_of_metric, z):
+    """
+    Parameters:
+        statistics_of_metric (RunningStatistics): values of the metric in the replications so far
+        z (float): quantile of the normal distribution for the confidence level
+
+    Returns:
+        float: half-width of the confidence interval relative to the mean, inf for less than two
+            replications or a mean of 0
+    """
+    if statistics_of_metric.count < 2 or statistics_of_metric.mean == 0:
+        return float("inf")
+    half_width = z * statistics_of_metric.standard_deviation / statistics_of_metric.count ** 0.5
+    return half_width / abs(statistics_of_metric.mean)
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+"""
+    Summary of the replications table (one row per replication, as read from the results files).
+
+    Mean, standard deviation, minimum, maximum and the replications of the extremes of every
+    column come from column-wise NumPy reductions over one float array of the table, instead of
+    appending rows to the table in a loop. The table itself is not changed, so later
+    reductions never see summary rows, and the summary is a frame of its own.
+"""
+
+# Rows of the summary frame
+SUMMARY_ROWS = ("Mean", "Standard Deviation", "Min", "Max", "Argmin", "Argmax")
+
+
+def summarize(df):
+    """
+    Mean, standard deviation (ddof=1 like pandas), minimum, maximum and the positions of the
+    minimum and maximum of every numeric column, NaN values are ignored
+
+    Parameters:
+        df (DataFrame): replications table
+
+    Returns:
+        DataFrame: one row per statistic of SUMMARY_ROWS, one column per numeric column of df
+    """
+    numeric = df.select_dtypes(include="number")
+    values = numeric.to_numpy(dtype=np.float64)
+    missing = np.isnan(values)
+    counts = (~missing).sum(axis=0)
+
+    # Sums of the values and of their squared deviations, NaN values count as 0
+    filled = np.where(missing, 0.0, values)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = filled.sum(axis=0) / counts
+        deviations = np.where(missing, 0.0, values - mean)
+        std = np.sqrt((deviations * deviations).sum(axis=0) / (counts - 1))
+
+    # Extremes, NaN values can never be the extreme of a column
+    argmin = np.where(missing, np.inf, values).argmin(axis=0)
+    argmax = np.where(missing, -np.inf, values).argmax(axis=0)
+    columns = np.arange(values.shape[1])
+    empty = counts == 0
+    minimum = np.where(empty, np.nan, values[argmin, columns])
+    maximum = np.where(empty, np.nan, values[argmax, columns])
+    std = np.where(counts > 1, std, np.nan)
+
+    return pd.DataFrame(
+        [mean, std, minimum, maximum, np.where(empty, np.nan, argmin), np.where(empty, np.nan, argmax)],
+        index=list(SUMMARY_ROWS), columns=numeric.columns)
+
+
+def selected_replications(df, summary=None):
+    """
+    Mean, the replications with the maximum and minimum of every column ("Max <column>",
+    "Min <column>") and the standard deviation, e.g. to compare selected days in a bar plot
+
+    Parameters:
+        df (DataFrame): replications table
+        summary (DataFrame, optional): summary of df, calculated if not given
+
+    Returns:
+        DataFrame: selected rows with the numeric columns of df
+    """
+    if summary is None:
+        summary = summarize(df)
+    numeric = df[summary.columns]
+    present = summary.columns[summary.loc["Argmax"].notna()]
+
+    # All extreme replications in one take, interleaved as Max and Min per column
+    positions = np.column_stack((summary.loc["Argmax", present], summary.loc["Argmin", present])).ravel()
+    extremes = numeric.iloc[positions.astype(np.int64)]
+    extremes.index = [f"{kind} {column}" for column in present for kind in ("Max", "Min")]
+
+    return pd.concat([summary.loc[["Mean"]], extremes, summary.loc[["Standard Deviation"]]])
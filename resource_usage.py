@@ -0,0 +1,144 @@
+import simpy
+from heap_resource import HeapPriorityResource
+from aging_resource import AgingPriorityResource
+
+"""
+    Busy time, idle time and throughput of the resources.
+
+    TrackedResource, TrackedPriorityResource, TrackedHeapPriorityResource and
+    TrackedAgingPriorityResource are drop-in replacements of simpy.Resource,
+    simpy.PriorityResource, HeapPriorityResource and AgingPriorityResource. Every time
+    a request is granted or released, the number of busy servers changes and the busy
+    server-time since the last change is added up. So utilization,
+    idle time and throughput are known at the end of a run with a few numbers per resource,
+    no matter how long the run is. The heap based engine fills the same ResourceUsage objects.
+"""
+
+# Names of the resources of the emergency room, in the order of the engines
+RESOURCE_NAMES = ("registration", "cw1", "cw2", "x_ray", "plaster")
+
+
+class ResourceUsage:
+    """
+    Busy server-time and completed services of one resource
+    """
+    __slots__ = ("capacity", "busy", "busy_time", "last_time", "end_time", "completions")
+
+    def __init__(self, capacity, start_time=0.0):
+        """
+        Parameters:
+            capacity (int): Number of servers of the resource
+            start_time (float): time the accounting starts
+        """
+        self.capacity = capacity
+        self.busy = 0
+        self.busy_time = 0.0
+        self.last_time = start_time
+        self.end_time = None
+        self.completions = 0
+
+    @classmethod
+    def from_totals(cls, capacity, busy_time, completions, end_time):
+        """
+        Creates the usage of a run whose totals are known (e.g. from a vectorized engine)
+
+        Parameters:
+            capacity (int): Number of servers of the resource
+            busy_time (float): busy server-time of the run
+            completions (int): Number of completed services
+            end_time (float): end of the run
+
+        Returns:
+            ResourceUsage: usage of the resource
+        """
+        usage = cls(capacity)
+        usage.busy_time = float(busy_time)
+        usage.completions = int(completions)
+        usage.last_time = usage.end_time = float(end_time)
+        return usage
+
+    def start(self, now):
+        """
+        A server starts a service
+        """
+        self.busy_time += (now - self.last_time) * self.busy
+        self.last_time = now
+        self.busy += 1
+
+    def finish(self, now):
+        """
+        A server finishes a service
+        """
+        self.busy_time += (now - self.last_time) * self.busy
+        self.last_time = now
+        self.busy -= 1
+        self.completions += 1
+
+    def end(self, now):
+        """
+        Ends the accounting at the end of the run
+        """
+        self.busy_time += (now - self.last_time) * self.busy
+        self.last_time = self.end_time = now
+
+    def summary(self):
+        """
+        Returns:
+            dict: busy and idle server-time, utilization and throughput (services per minute) of the run
+        """
+        end_time = self.end_time if self.end_time is not None else self.last_time
+        available_time = self.capacity * end_time
+        return {
+            "busy_time": self.busy_time,
+            "idle_time": available_time - self.busy_time,
+            "utilization": self.busy_time / available_time if available_time > 0 else 0.0,
+            "throughput": self.completions / end_time if end_time > 0 else 0.0,
+        }
+
+
+class UsageTracking:
+    """
+    Mixin for SimPy resources, counts the busy servers when requests are granted and released
+    """
+
+    def __init__(self, env, *args, **kwargs):
+        super().__init__(env, *args, **kwargs)
+        self.usage = ResourceUsage(self.capacity, env.now)
+
+    def _do_put(self, event):
+        users = len(self.users)
+        result = super()._do_put(event)
+        if len(self.users) > users:
+            self.usage.start(self._env.now)
+        return result
+
+    def _do_get(self, event):
+        users = len(self.users)
+        result = super()._do_get(event)
+        if len(self.users) < users:
+            self.usage.finish(self._env.now)
+        return result
+
+
+class TrackedResource(UsageTracking, simpy.Resource):
+    """
+    simpy.Resource with busy time accounting
+    """
+
+
+class TrackedPriorityResource(UsageTracking, simpy.PriorityResource):
+    """
+    simpy.PriorityResource with busy time accounting
+    """
+
+
+class TrackedHeapPriorityResource(UsageTracking, HeapPriorityResource):
+    """
+    HeapPriorityResource with busy time accounting
+    """
+
+
+class TrackedAgingPriorityResource(UsageTracking, AgingPriorityResource):
+    """
+    AgingPriorityResource with busy time accounting
+    """
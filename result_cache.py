@@ -0,0 +1,315 @@
+import os
+import ast
+import sys
+import json
+import pickle
+import hashlib
+import inspect
+
+"""
+    Content-addressed cache of simulation results.
+
+    The key of a run is a hash of the complete scenario: the source code of the Task module (it
+    defines the capacities, the distribution parameters, the routing and the priority rule), the
+    source code of every module of this project it imports, directly or through other modules
+    (model code version), and all arguments of run_simulation including their defaults (seed,
+    replication, num_patients, cw_limit, ...). Editing the model therefore never returns stale
+    results, the old entries are just no longer used and are evicted.
+
+    Arguments that aren't plain values need a key() method with their content (e.g. NHPPArrivals),
+    other objects are rejected instead of being hashed by their address. Runs with side effects
+    (profile, stream) are never cached.
+
+    Every entry is a pickle file named after its key. The modification time of the file is the
+    time of its last use, the least recently used entries are removed when the cache is larger
+    than its bounds. Entries are written to a temporary file and renamed, so several worker
+    processes can share one cache directory.
+"""
+
+# Arguments of run_simulation whose runs have side effects besides the results, never cached
+UNCACHED_ARGUMENTS = ("profile", "stream")
+
+
+def local_imports(module_name):
+    """
+    Modules of this project a module imports, directly or through other modules of the project,
+    found in the source code (imports in the main program are left out)
+
+    Parameters:
+        module_name (str): name of the module
+
+    Returns:
+        tuple: sorted names of the module and all modules of the project it depends on
+    """
+    module = sys.modules.get(module_name) or __import__(module_name)
+    directory = os.path.dirname(os.path.abspath(module.__file__))
+    found = set()
+    pending = [module_name]
+    while pending:
+        name = pending.pop()
+        if name in found:
+            continue
+        found.add(name)
+        with open(os.path.join(directory, f"{name}.py"), "rb") as file:
+            tree = ast.parse(file.read())
+        for statement in tree.body:
+            if _is_main_program(statement):
+                continue
+            for node in ast.walk(statement):
+                if isinstance(node, ast.Import):
+                    names = [alias.name for alias in node.names]
+                elif isinstance(node, ast.ImportFrom) and not node.level and node.module:
+                    names = [node.module]
+                else:
+                    continue
+                pending.extend(imported for imported in names
+                               if os.path.exists(os.path.join(directory, f"{imported}.py")))
+    return tuple(sorted(found))
+
+
+def _is_main_program(statement):
+    """
+    Returns:
+        bool: whether the statement is the block of if __name__ == "__main__"
+    """
+    return (isinstance(statement, ast.If) and isinstance(statement.test, ast.Compare)
+            and isinstance(statement.test.left, ast.Name) and statement.test.left.id == "__name__")
+
+
+def stable_key(value):
+    """
+    Key of an argument that isn't a plain JSON value
+
+    Parameters:
+        value: argument of run_simulation
+
+    Returns:
+        key of the value from its key() method
+    """
+    key = getattr(value, "key", None)
+    if not callable(key):
+        raise TypeError(f"Argument of type {type(value).__name__} has no stable key for the cache, "
+                        f"give it a key() method")
+    return {"type": type(value).__name__, "key": key()}
+
+
+def code_version(module_names):
+    """
+    Parameters:
+        module_names (tuple): names of the modules
+
+    Returns:
+        str: hash of the source code of the modules
+    """
+    digest = hashlib.sha256()
+    for name in module_names:
+        module = sys.modules.get(name) or __import__(name)
+        with open(module.__file__, "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Size-bounded LRU cache of (results, stats) of run_simulation on disk
+    """
+
+    def __init__(self, directory="cache", max_entries=10000, max_bytes=512 * 1024 * 1024):
+        """
+        Parameters:
+            directory (str): directory of the cache files, generated if it doesn't exist
+            max_entries (int): Maximum number of entries
+            max_bytes (int): Maximum total size of the entries in bytes
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.code_versions = {}
+
+    def key(self, run_simulation, **kwargs):
+        """
+        Hash of the scenario of a run
+
+        Parameters:
+            run_simulation (function): run_simulation function of one of the Task modules
+            **kwargs: keyword arguments for run_simulation
+
+        Returns:
+            str: key of the run in the cache
+        """
+        module_name = run_simulation.__module__
+        if module_name not in self.code_versions:
+            self.code_versions[module_name] = code_version(local_imports(module_name))
+
+        # Defaults are part of the scenario, whether the results are saved is not
+        arguments = inspect.signature(run_simulation).bind(**kwargs)
+        arguments.apply_defaults()
+        arguments = {name: value for name, value in arguments.arguments.items() if name != "save"}
+        if not cacheable(arguments):
+            raise ValueError(f"Runs with {', '.join(UNCACHED_ARGUMENTS)} have side effects and aren't cached")
+
+        scenario = {
+            "module": module_name,
+            "function": run_simulation.__qualname__,
+            "code": self.code_versions[module_name],
+            "arguments": arguments,
+        }
+        return hashlib.sha256(json.dumps(scenario, sort_keys=True, default=stable_key).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, key):
+        """
+        Parameters:
+            key (str): key of the run
+
+        Returns:
+            tuple: stored (results, stats), None on a miss
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as file:
+                entry = pickle.load(file)
+            os.utime(path)  # Mark as recently used
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        return entry
+
+    def put(self, key, entry):
+        """
+        Stores an entry and evicts the least recently used entries if the cache is too large
+
+        Parameters:
+            key (str): key of the run
+            entry (tuple): (results, stats) of the run
+        """
+        path = self._path(key)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as file:
+            pickle.dump(entry, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+        self.evict()
+
+    def run(self, run_simulation, save=False, **kwargs):
+        """
+        Returns the stored results of the scenario or runs the simulation and stores them.
+        On a hit nothing is saved, so the results files get no duplicate rows. Runs with a
+        profile or a stream are run without the cache.
+
+        Parameters:
+            run_simulation (function): run_simulation function of one of the Task modules
+            save (bool): Save the statistics in the results directory if the simulation is run
+            **kwargs: further keyword arguments for run_simulation
+
+        Returns:
+            tuple: calculated statistics and patient data of the run
+        """
+        if not cacheable(kwargs):
+            return run_simulation(save=save, **kwargs)
+        key = self.key(run_simulation, **kwargs)
+        entry = self.get(key)
+        if entry is None:
+            entry = run_simulation(save=save, **kwargs)
+            self.put(key, entry)
+        return entry
+
+    def wrap(self, run_simulation):
+        """
+        Parameters:
+            run_simulation (function): run_simulation function of one of the Task modules
+
+        Returns:
+            CachedSimulation: drop-in replacement of run_simulation using the cache, can be passed
+                to replication_runner.run_replications
+        """
+        return CachedSimulation(self, run_simulation)
+
+    def invalidate(self, run_simulation, **kwargs):
+        """
+        Removes the entry of a scenario
+
+        Parameters:
+            run_simulation (function): run_simulation function of one of the Task modules
+            **kwargs: keyword arguments for run_simulation
+
+        Returns:
+            bool: whether there was an entry
+        """
+        try:
+            os.remove(self._path(self.key(run_simulation, **kwargs)))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def clear(self):
+        """
+        Removes all entries
+        """
+        for path, size, used in self._entries():
+            _remove(path)
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache is within its bounds
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total_bytes = sum(size for path, size, used in entries)
+        while entries and (len(entries) > self.max_entries or total_bytes > self.max_bytes):
+            path, size, used = entries.pop(0)
+            _remove(path)
+            total_bytes -= size
+
+    def _entries(self):
+        """
+        Returns:
+            list: path, size and time of last use of every entry
+        """
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for item in scan:
+                if item.name.endswith(".pkl"):
+                    try:
+                        stat = item.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((item.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def __len__(self):
+        return len(self._entries())
+
+
+class CachedSimulation:
+    """
+    run_simulation of a Task module in front of a ResultCache, picklable for worker processes
+    """
+
+    def __init__(self, cache, run_simulation):
+        self.cache = cache
+        self.run_simulation = run_simulation
+
+    def __call__(self, save=False, **kwargs):
+        return self.cache.run(self.run_simulation, save=save, **kwargs)
+
+
+def cacheable(arguments):
+    """
+    Parameters:
+        arguments (dict): arguments of run_simulation
+
+    Returns:
+        bool: whether the run has no side effects besides its results (no profile, no stream)
+    """
+    return not any(arguments.get(name) for name in UNCACHED_ARGUMENTS)
+
+
+def _remove(path):
+    """
+    Removes a file, a file removed in the meantime (e.g. by another process) is ignored
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
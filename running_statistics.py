@@ -0,0 +1,120 @@
+import math
+
+"""
+    Single pass statistics of the treatment times.
+
+    The patient process adds its total time at departure, so the mean and standard deviation
+    are known at the end of the run without keeping a list of all patients and without a second
+    pass over the times (Welford's algorithm). Statistics of separate replications can be merged
+    into the statistics of all of them (Chan et al.).
+"""
+
+
+class RunningStatistics:
+    """
+    Count, mean and sum of squared differences from the mean of a stream of values
+    """
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    @classmethod
+    def from_moments(cls, count, mean, m2):
+        """
+        Creates the statistics of values aggregated elsewhere (e.g. vectorized with NumPy)
+
+        Parameters:
+            count (int): Number of values
+            mean (float): mean of the values
+            m2 (float): sum of squared differences from the mean
+
+        Returns:
+            RunningStatistics: statistics of the values
+        """
+        statistics = cls()
+        statistics.count = int(count)
+        statistics.mean = float(mean)
+        statistics.m2 = float(m2)
+        return statistics
+
+    def add(self, value):
+        """
+        Adds a single value
+
+        Parameters:
+            value (float): new value
+        """
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merge(self, other):
+        """
+        Adds all values of another RunningStatistics
+
+        Parameters:
+            other (RunningStatistics): statistics to merge into this one
+        """
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+
+    @property
+    def variance(self):
+        """
+        Returns:
+            float: sample variance of the values, 0 for less than two values
+        """
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def standard_deviation(self):
+        """
+        Returns:
+            float: sample standard deviation of the values, 0 for less than two values
+        """
+        return math.sqrt(self.variance)
+
+
+class PatientTimeStatistics:
+    """
+    Running statistics of the total time of all patients and of each patient type
+    """
+
+    def __init__(self, patient_types=(1, 2, 3, 4)):
+        """
+        Parameters:
+            patient_types (tuple): patient types with their own statistics
+        """
+        self.overall = RunningStatistics()
+        self.types = {patient_type: RunningStatistics() for patient_type in patient_types}
+
+    def add(self, patient_type, total_time):
+        """
+        Adds the total time of a departing patient
+
+        Parameters:
+            patient_type (int): type of the patient
+            total_time (float): time of the patient in the emergency room
+        """
+        self.overall.add(total_time)
+        self.types[patient_type].add(total_time)
+
+    def merge(self, other):
+        """
+        Adds the statistics of another replication
+
+        Parameters:
+            other (PatientTimeStatistics): statistics to merge into this one
+        """
+        self.overall.merge(other.overall)
+        for patient_type, statistics in other.types.items():
+            self.types.setdefault(patient_type, RunningStatistics()).merge(statistics)
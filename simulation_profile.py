@@ -0,0 +1,195 @@
+import time
+import tracemalloc
+import contextlib
+from collections import defaultdict
+import simpy
+
+"""
+    Opt-in profiling of a simulation run.
+
+    The profiler counts the processed SimPy events, measures the wall time of the run and of its
+    parts (generate_patients, patient by patient type, calc_statistics, saving) and the peak
+    memory with tracemalloc. The time of a process is the time spent inside its generator
+    between two yields, the rest of the run is spent in SimPy itself (scheduling and resources).
+
+    Without profiling run_simulation uses a plain simpy.Environment and no-op sections, so it
+    costs nothing. record() returns one flat, JSON serializable record per replication, which
+    run_simulation stores in results["profile"] next to the statistics. A benchmark that only needs
+    the event count can pass its own SimulationProfiler without memory tracing and process timing.
+"""
+
+
+class ProfilingEnvironment(simpy.Environment):
+    """
+    simpy.Environment that counts the processed events and measures the time spent in every process
+    """
+
+    def __init__(self, profiler, initial_time=0):
+        super().__init__(initial_time)
+        self.profiler = profiler
+        self.events = 0
+
+    def step(self):
+        self.events += 1
+        super().step()
+
+    def process(self, generator):
+        if not self.profiler.processes:
+            return super().process(generator)
+        # Patients are profiled per type, the type is an argument of the generator function
+        name = generator.__name__
+        if name == "patient":
+            name = f"patient type {generator.gi_frame.f_locals.get('patient_type')}"
+        return super().process(self.profiler.timed(generator, name))
+
+
+class SimulationProfiler:
+    """
+    Events, wall times and peak memory of one simulation run
+    """
+
+    def __init__(self, enabled=True, memory=True, processes=True):
+        """
+        Parameters:
+            enabled (bool): without profiling all methods are no-ops
+            memory (bool): Trace the peak memory with tracemalloc (slows the run down considerably)
+            processes (bool): Measure the time spent in every process
+        """
+        self.enabled = enabled
+        self.memory = memory
+        self.processes = processes
+        self.wall_times = defaultdict(float)
+        self.env = None
+        self.events = 0
+        self.sim_time = 0.0
+        self.started_tracemalloc = False
+        self.start_time = None
+
+    def start(self):
+        """
+        Starts the wall clock and the tracing of the memory
+        """
+        if not self.enabled:
+            return
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracemalloc = True
+        if self.memory:
+            tracemalloc.reset_peak()
+        self.start_time = time.perf_counter()
+
+    def environment(self):
+        """
+        Returns:
+            Environment: environment that counts events and times processes if profiling
+        """
+        if not self.enabled:
+            return simpy.Environment()
+        self.env = ProfilingEnvironment(self)
+        return self.env
+
+    def section(self, name):
+        """
+        Parameters:
+            name (str): name of a part of the run, e.g. "calc_statistics"
+
+        Returns:
+            context manager that adds the wall time of the block to the section
+        """
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._timed_section(name)
+
+    @contextlib.contextmanager
+    def _timed_section(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.wall_times[name] += time.perf_counter() - start
+
+    def count(self, events, sim_time):
+        """
+        Events and simulated time of an engine without SimPy environment
+
+        Parameters:
+            events (int): Number of processed events
+            sim_time (float): simulated time at the end of the run
+        """
+        self.events = events
+        self.sim_time = sim_time
+
+    def timed(self, generator, name):
+        """
+        Wraps a process generator, the time spent in it between two yields is added to its section
+
+        Parameters:
+            generator (generator): process of the simulation
+            name (str): name of the section
+
+        Returns:
+            generator: process with the same events and values
+        """
+        wall_times = self.wall_times
+        clock = time.perf_counter
+        value, error = None, None
+        while True:
+            start = clock()
+            try:
+                event = generator.throw(error) if error is not None else generator.send(value)
+            except StopIteration as stop:
+                wall_times[name] += clock() - start
+                return stop.value
+            wall_times[name] += clock() - start
+            value, error = None, None
+            try:
+                value = yield event
+            except BaseException as exception:
+                error = exception
+
+    def record(self):
+        """
+        Ends the profiling
+
+        Returns:
+            dict: events, simulated and wall time, events per second, wall time of every section
+                and peak memory of the run (None without memory tracing), empty if not profiling
+        """
+        if not self.enabled:
+            return {}
+        wall_time = time.perf_counter() - self.start_time
+        peak = tracemalloc.get_traced_memory()[1] if self.memory else None
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+            self.started_tracemalloc = False
+
+        if self.env is not None:
+            self.events = self.env.events
+            self.sim_time = self.env.now
+            self.env = None
+
+        simulation_time = self.wall_times.get("simulation", 0.0)
+        record = {
+            "events": self.events,
+            "sim_time": self.sim_time,
+            "wall_time": wall_time,
+            "sim_wall_ratio": self.sim_time / simulation_time if simulation_time > 0 else 0.0,
+            "events_per_second": self.events / simulation_time if simulation_time > 0 else 0.0,
+            "peak_memory": peak,
+        }
+        for name, seconds in sorted(self.wall_times.items()):
+            record[f"wall_time {name}"] = seconds
+        return record
+
+
+def profiler_for(profile):
+    """
+    Parameters:
+        profile (bool or SimulationProfiler): profile argument of run_simulation
+
+    Returns:
+        SimulationProfiler: the given profiler, or a new one enabled if profile is True
+    """
+    if isinstance(profile, SimulationProfiler):
+        return profile
+    return SimulationProfiler(enabled=profile)
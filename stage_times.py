@@ -0,0 +1,74 @@
+import numpy as np
+
+"""
+    Waiting and service time of every patient at every stage of the path.
+
+    The patient process notes the time it waited for a resource and the time it was served at
+    every stage, at departure one row per patient is added to typed columns (PatientRecords
+    with the columns of STAGE_COLUMNS). Stages a patient doesn't visit are NaN. The wait for the
+    doctors before t=30 counts as waiting at the first visit of the casualty ward.
+
+    stage_breakdown aggregates the columns per patient type and stage, so it can be seen where
+    the patients of a type lose their time.
+"""
+
+# Stages of the patient paths, the second visits of X-ray and casualty ward are stages of their own
+STAGES = ("registration", "cw", "x_ray", "plaster", "x_ray_2", "cw_2")
+
+# Stages of every patient type in the order of the path (indices of STAGES)
+STAGE_ROUTES = {
+    1: (0, 1, 2, 5),
+    2: (0, 1, 3),
+    3: (0, 1, 2, 3, 4, 5),
+    4: (0, 1),
+}
+
+# Name and type of the columns of the stage records
+STAGE_COLUMNS = (("id", np.int64), ("type", np.int8)) + tuple(
+    (f"{stage}_{kind}", np.float64) for stage in STAGES for kind in ("wait", "service")
+)
+
+NOT_VISITED = (float("nan"), float("nan"))
+
+
+def stage_row(stage_times):
+    """
+    Parameters:
+        stage_times (dict): (wait, service) of the visited stages by name
+
+    Returns:
+        list: wait and service time of every stage in the order of STAGE_COLUMNS, NaN if not visited
+    """
+    row = []
+    for stage in STAGES:
+        row.extend(stage_times.get(stage, NOT_VISITED))
+    return row
+
+
+def stage_breakdown(records, patient_types=(1, 2, 3, 4)):
+    """
+    Average waiting and service time per patient type and stage
+
+    Parameters:
+        records (PatientRecords): stage records of the patients
+        patient_types (tuple): patient types of the breakdown
+
+    Returns:
+        dict: count, average wait and average service time of every visited stage, by patient type and stage
+    """
+    types = records["type"]
+    breakdown = {}
+    for patient_type in patient_types:
+        of_type = types == patient_type
+        breakdown[patient_type] = {}
+        for stage in STAGES:
+            wait = records[f"{stage}_wait"][of_type]
+            visited = ~np.isnan(wait)
+            count = int(visited.sum())
+            if count:
+                breakdown[patient_type][stage] = {
+                    "count": count,
+                    "avg_wait": float(wait[visited].mean()),
+                    "avg_service": float(records[f"{stage}_service"][of_type][visited].mean()),
+                }
+    return breakdown
@@ -0,0 +1,181 @@
+import statistics
+import numpy as np
+
+"""
+    Steady-state estimates from one long run instead of many short replications.
+
+    Every run starts with an empty emergency room and the doctors arriving at t=30, so the first
+    patients are faster (empty queues) or slower (no doctors) than in the long run. run_steady_state
+    simulates one long run and looks at the times of the patients in the order they left.
+    MSER-5 finds the warm-up: the stream is cut into batches of 5, the truncation point is the
+    number of batches whose removal minimizes the standard error of the mean of the rest
+    (searched in the first half of the run). The patients who left before it are discarded.
+
+    The rest is divided into a few large batches. Their means are nearly independent and
+    normally distributed if the batches are long enough compared to the correlation of the
+    patients, so mean and confidence interval follow from the batch means like from independent
+    replications (Student t with batches - 1 degrees of freedom). The lag-1 correlation of the
+    batch means is reported as a check, it should be close to 0.
+
+    A steady state only exists if every resource is busy less than all the time. If the queues
+    keep growing (as in the given scenarios, where casualty ward 1 is busy all the time) the
+    minimum of MSER lies at the end of the searched range, the report marks this with at_limit
+    and the estimates are not steady-state values.
+"""
+
+# Batch size of the MSER-5 rule
+MSER_BATCH_SIZE = 5
+
+
+def mser(values, batch_size=MSER_BATCH_SIZE):
+    """
+    Truncation point of the warm-up by the MSER rule (MSER-5 for batches of 5)
+
+    Parameters:
+        values (ndarray): output stream in the order of the observations
+        batch_size (int): size of the batches the rule is applied to
+
+    Returns:
+        tuple: number of observations to discard and whether the minimum is at the end of the
+            searched range (the run is likely too short to reach the steady state)
+    """
+    batches = len(values) // batch_size
+    if batches < 2:
+        return 0, False
+    means = np.asarray(values[:batches * batch_size], dtype=np.float64).reshape(batches, batch_size).mean(axis=1)
+
+    # Sums of the batch means from batch d to the end, for every d
+    suffix_sum = np.cumsum(means[::-1])[::-1]
+    suffix_squares = np.cumsum((means * means)[::-1])[::-1]
+    remaining = np.arange(batches, 0, -1, dtype=np.float64)
+
+    # MSER(d) = sum over the remaining batches (Z_j - mean)^2 / (batches - d)^2, for d up to half of the batches
+    limit = batches // 2 + 1
+    squared_deviations = suffix_squares[:limit] - suffix_sum[:limit] ** 2 / remaining[:limit]
+    statistic = np.maximum(squared_deviations, 0.0) / remaining[:limit] ** 2
+    truncation = int(np.argmin(statistic))
+    return truncation * batch_size, truncation == limit - 1
+
+
+def t_quantile(probability, degrees):
+    """
+    Quantile of Student's t distribution by the Cornish-Fisher expansion around the normal
+    quantile (Abramowitz & Stegun 26.7.5), accurate to about 1e-3 from 5 degrees of freedom
+
+    Parameters:
+        probability (float): cumulative probability
+        degrees (int): degrees of freedom
+
+    Returns:
+        float: quantile
+    """
+    z = statistics.NormalDist().inv_cdf(probability)
+    return (z
+            + (z ** 3 + z) / (4 * degrees)
+            + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * degrees ** 2)
+            + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * degrees ** 3)
+            + (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / (92160 * degrees ** 4))
+
+
+def batch_means(values, batches=30, confidence=0.95):
+    """
+    Mean and confidence interval of a stationary output stream by non-overlapping batch means
+
+    Parameters:
+        values (ndarray): output stream after the warm-up
+        batches (int): Number of batches, observations that don't fill a batch are left out at the start
+        confidence (float): confidence level of the interval
+
+    Returns:
+        dict: mean, half-width, relative half-width, batch size and lag-1 correlation of the batch means
+    """
+    values = np.asarray(values, dtype=np.float64)
+    batch_size = len(values) // batches
+    if batches < 2 or batch_size < 1:
+        raise ValueError(f"{len(values)} observations are too few for {batches} batches")
+
+    # The oldest observations are dropped, they are the closest to the warm-up
+    means = values[len(values) - batches * batch_size:].reshape(batches, batch_size).mean(axis=1)
+    mean = float(means.mean())
+    standard_deviation = float(means.std(ddof=1))
+    half_width = t_quantile((1 + confidence) / 2, batches - 1) * standard_deviation / batches ** 0.5
+
+    deviations = means - mean
+    squares = float(deviations @ deviations)
+    correlation = float(deviations[:-1] @ deviations[1:]) / squares if squares > 0 else 0.0
+    return {
+        "mean": mean,
+        "half_width": half_width,
+        "relative_half_width": half_width / abs(mean) if mean else float("inf"),
+        "batch_size": batch_size,
+        "batch_correlation": correlation,
+    }
+
+
+# Arguments of run_simulation set by run_steady_state, MSER needs the records of all patients
+RESERVED_ARGUMENTS = ("keep_patients", "stream")
+
+
+def run_steady_state(run_simulation, num_patients=100000, batches=30, confidence=0.95, patient_types=(1, 2, 3, 4),
+                     save=False, **kwargs):
+    """
+    Runs one long simulation, discards the warm-up found by MSER-5 on the departure stream and
+    estimates the steady-state times by batch means
+
+    Parameters:
+        run_simulation (function): run_simulation function of one of the Task modules
+        num_patients (int): Number of patients of the run
+        batches (int): Number of batches for the confidence intervals
+        confidence (float): confidence level of the intervals
+        patient_types (tuple): patient types with an estimate of their own
+        save (bool): whether run_simulation saves the statistics and the raw data of the run
+        **kwargs: further keyword arguments for run_simulation (e.g. seed, engine, cw_limit).
+            keep_patients and stream are not allowed, the run always keeps the records of all
+            patients in memory
+
+    Returns:
+        tuple: (results, stats) of the run and a report with the warm-up and the estimate of the
+            overall time and of the time of every patient type
+    """
+    reserved = [name for name in RESERVED_ARGUMENTS if name in kwargs]
+    if reserved:
+        raise ValueError(f"run_steady_state needs the records of all patients, {', '.join(reserved)} can't be given")
+    results, stats = run_simulation(num_patients=num_patients, keep_patients=True, save=save, **kwargs)
+
+    records = stats["patients"]
+    order = np.argsort(records["departure"], kind="stable")
+    departures = records["departure"][order]
+    times = records.total_time()[order]
+    types = records["type"][order]
+
+    truncation, at_limit = mser(times)
+    warmup_end = float(departures[truncation - 1]) if truncation else 0.0
+
+    report = {
+        "warmup": {"patients": truncation, "time": warmup_end, "at_limit": at_limit},
+        "overall_avg_time": {**batch_means(times[truncation:], batches, confidence),
+                             "patients": len(times) - truncation},
+    }
+    for patient_type in patient_types:
+        # Each type is cut at the same point of the departure stream as all patients
+        type_times = times[truncation:][types[truncation:] == patient_type]
+        if len(type_times) >= 2 * batches:
+            report[patient_type] = {**batch_means(type_times, batches, confidence), "patients": len(type_times)}
+    return (results, stats), report
+
+
+if __name__ == "__main__":
+    import io
+    import contextlib
+    import Task_1
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        run, report = run_steady_state(Task_1.run_simulation, num_patients=100000, engine="fast")
+    warmup = report.pop("warmup")
+    print(f"Warm-up: {warmup['patients']} patients until t = {warmup['time']:.1f} minutes")
+    if warmup["at_limit"]:
+        print("No steady state found, the queues are still growing at the end of the run")
+    for metric, estimate in report.items():
+        print(f"{metric}: {estimate['mean']:.2f} +/- {estimate['half_width']:.2f} minutes "
+              f"({estimate['patients']} patients, batch size {estimate['batch_size']}, "
+              f"lag-1 correlation {estimate['batch_correlation']:.2f})")
@@ -0,0 +1,95 @@
+import random
+import simpy
+from aging_resource import AgingPriorityResource, AgingRequest, StaticPriority, ThresholdAging
+from simpy.core import BoundClass
+
+
+class RescanQueue(list):
+    """
+    Put queue that evaluates the priority of every waiting request at every dispatch
+    """
+
+    def __init__(self, env, policy):
+        super().__init__()
+        self.env = env
+        self.policy = policy
+
+    def _best(self):
+        now = self.env.now
+        keys = [(self.policy.priority(request, now), request.time, not request.preempt, index)
+                for index, request in enumerate(list.__iter__(self))]
+        return min(keys)[-1]
+
+    def __getitem__(self, index):
+        if index == 0:
+            return list.__getitem__(self, self._best())
+        return list.__getitem__(self, index)
+
+    def pop(self, index=0):
+        return list.pop(self, self._best() if index == 0 else index)
+
+
+class RescanResource(simpy.PriorityResource):
+    def __init__(self, env, capacity=1, policy=None):
+        super().__init__(env, capacity)
+        self.put_queue = RescanQueue(env, policy)
+
+    request = BoundClass(AgingRequest)
+
+
+def grant_order(resource_type, policy, seed=5, users=1500):
+    """
+    Order in which a resource grants requests of patients with random arrival times, some cancelled
+    """
+    env = simpy.Environment()
+    resource = resource_type(env, capacity=2, policy=policy)
+    rng = random.Random(seed)
+    granted = []
+
+    def user(number, priority, request_time, arrival, patience):
+        yield env.timeout(request_time)
+        with resource.request(priority=priority, patient=arrival) as req:
+            result = yield req | env.timeout(patience)
+            if req in result:
+                granted.append((number, env.now))
+                yield env.timeout(rng.random())
+
+    for number in range(users):
+        request_time = rng.random() * 300
+        # Some requests don't age (no patient), the others arrived up to 90 minutes before the request
+        arrival = None if rng.random() < 0.3 else request_time - rng.random() * 90
+        env.process(user(number, rng.choice((0, 1)), request_time, arrival, rng.random() * 60))
+    env.run()
+    return granted
+
+
+def test_aging_order_matches_rescan():
+    policy = ThresholdAging(threshold=60, promoted_priority=-1)
+    order = grant_order(AgingPriorityResource, policy)
+    assert order == grant_order(RescanResource, policy)
+    # The promotions change the order compared to fixed priorities
+    assert order != grant_order(AgingPriorityResource, StaticPriority())
+
+
+def test_static_order_matches_rescan():
+    assert grant_order(AgingPriorityResource, StaticPriority()) == grant_order(RescanResource, StaticPriority())
+
+
+def test_waiting_request_is_promoted():
+    env = simpy.Environment()
+    resource = AgingPriorityResource(env, capacity=1, policy=ThresholdAging(60, -1))
+    granted = []
+
+    def user(name, request_time, arrival, hold):
+        yield env.timeout(request_time)
+        with resource.request(patient=arrival) as req:
+            yield req
+            granted.append(name)
+            yield env.timeout(hold)
+
+    env.process(user("blocker", 0, None, 100))
+    env.process(user("early", 1, 50, 1))
+    # Requests later, but passes the 60 minutes at t=60 while waiting
+    env.process(user("late", 2, 0, 1))
+    env.run()
+    assert granted == ["blocker", "late", "early"]
@@ -0,0 +1,49 @@
+import random
+import numpy as np
+import pytest
+from arrival_process import DAY, EXAMPLE_WEEK, NHPPArrivals, RateTable, interarrival_times
+
+
+TABLES = [
+    RateTable([0, 360, 720, 1080], [1.0, 3.0, 5.0, 2.0], DAY, "constant"),
+    RateTable([0, 360, 720, 1080], [1.0, 3.0, 5.0, 2.0], DAY, "linear"),
+    EXAMPLE_WEEK,
+]
+
+
+@pytest.mark.parametrize("table", TABLES)
+def test_inverse_of_cumulative_intensity(table):
+    t = np.linspace(0, 3 * table.period, 20001)
+    assert np.allclose(table.inverse(table.cumulative_intensity(t)), t, rtol=0, atol=1e-6)
+
+
+def test_inverse_skips_segments_without_arrivals():
+    table = RateTable([0, 300, 600], [1.0, 0.0, 2.0], DAY)
+    times = table.inverse(np.linspace(0, 5 * table.total, 10001))
+    assert not np.any((np.mod(times, DAY) > 300) & (np.mod(times, DAY) < 600))
+
+
+@pytest.mark.parametrize("max_rate", [None, 5.0])
+def test_arrivals_per_hour(max_rate):
+    # Inversion (no max_rate) and thinning give the expected number of arrivals per hour
+    table = TABLES[1]
+    times = NHPPArrivals(table, max_rate=max_rate).arrival_times(np.random.default_rng(1), 200000)
+    days = int(times[-1] // DAY)
+    times = times[times < days * DAY]
+    counted = np.bincount((np.mod(times, DAY) // 60).astype(np.int64), minlength=24)
+    expected = np.diff(table.cumulative_intensity(np.arange(25) * 60.0)) * days
+    # Poisson counts within 4 standard deviations
+    assert np.all(np.abs(counted - expected) < 4 * np.sqrt(expected))
+
+
+def test_homogeneous_interarrival_times_unchanged():
+    gaps = interarrival_times(random.Random(7))
+    rng = random.Random(7)
+    assert [next(gaps) for _ in range(100)] == [rng.expovariate(1 / 0.3) for _ in range(100)]
+
+
+def test_interarrival_times_add_up_to_arrival_times():
+    arrivals = NHPPArrivals(EXAMPLE_WEEK, start=8 * 60, block_size=100)
+    gaps = arrivals.interarrival_times(np.random.default_rng(3))
+    times = arrivals.arrival_times(np.random.default_rng(3), 1000)
+    assert np.allclose(np.cumsum([next(gaps) for _ in range(1000)]), times)
@@ -0,0 +1,47 @@
+import io
+import contextlib
+import numpy as np
+import pytest
+import Task_1
+import Task_3
+import Task_3v2
+import Task_3v3
+import Task_3v4
+
+
+def run(module, common_random_numbers=True):
+    with contextlib.redirect_stdout(io.StringIO()):
+        results, stats = module.run_simulation(num_patients=200, replication=1, save=False,
+                                               common_random_numbers=common_random_numbers)
+    return stats
+
+
+def by_id(records, column):
+    return records[column][np.argsort(records["id"])]
+
+
+def service_times(stages, *names):
+    # The draws of a stream end up with other patients when the order of service changes, so
+    # the services of its stages are compared as a sorted set
+    values = np.concatenate([stages[f"{name}_service"] for name in names])
+    return np.sort(values[~np.isnan(values)])
+
+
+@pytest.mark.parametrize("module", [Task_1, Task_3v2, Task_3v3, Task_3v4])
+def test_common_random_numbers_give_the_same_streams(module):
+    reference, other = run(Task_3), run(module)
+
+    # Same patients: arrival time and type of every patient, and the registration (FIFO for all)
+    for records, column in (("patients", "arrival"), ("patients", "type"), ("stages", "registration_service")):
+        assert np.array_equal(by_id(reference[records], column), by_id(other[records], column))
+
+    # Same service times in the stages of every stream
+    for names in (("cw", "cw_2"), ("x_ray", "x_ray_2"), ("plaster",)):
+        assert np.array_equal(service_times(reference["stages"], *names), service_times(other["stages"], *names))
+
+
+def test_independent_streams_differ_between_variants():
+    # Without common random numbers a different order of service shifts the later draws
+    reference, other = run(Task_3, common_random_numbers=False), run(Task_3v2, common_random_numbers=False)
+    assert not np.array_equal(service_times(reference["stages"], "x_ray", "x_ray_2"),
+                              service_times(other["stages"], "x_ray", "x_ray_2"))
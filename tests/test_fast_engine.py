@@ -0,0 +1,35 @@
+import io
+import contextlib
+import pytest
+import Task_1
+import Task_2
+import Task_3v3
+import Task_3v4
+from fast_engine import TARGET_SPEEDUP, check_speedup, validate_against_simpy
+
+
+@pytest.mark.parametrize("module", [Task_1, Task_2, Task_3v3, Task_3v4])
+def test_fast_engine_agrees_with_simpy(module):
+    with contextlib.redirect_stdout(io.StringIO()):
+        summary = validate_against_simpy(module.run_simulation, replications=20, num_patients=250)
+    assert abs(summary["z"]) < 3
+
+
+@pytest.mark.parametrize("module", [Task_1, Task_3v4])
+def test_fast_engine_reaches_target_speedup(module):
+    # Raises a RuntimeError below the target
+    summary = check_speedup(module.run_simulation, replications=2)
+    assert summary["speedup"] >= TARGET_SPEEDUP
+
+
+def test_fast_engine_processes_every_patient():
+    with contextlib.redirect_stdout(io.StringIO()):
+        results, stats = Task_3v4.run_simulation(num_patients=1000, engine="fast", save=False)
+    assert stats["times"].overall.count == 1000
+    assert len(stats["patients"]) == 1000
+    assert sorted(stats["patients"]["id"].tolist()) == list(range(1000))
+    # Every patient is registered once, every type 1 and 3 patient visits the casualty wards twice
+    types = stats["patients"]["type"]
+    assert stats["resources"]["registration"].completions == 1000
+    assert (stats["resources"]["cw1"].completions + stats["resources"]["cw2"].completions
+            == 1000 + int(((types == 1) | (types == 3)).sum()))
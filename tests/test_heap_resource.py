@@ -0,0 +1,46 @@
+import io
+import random
+import contextlib
+import numpy as np
+import simpy
+import Task_3v3
+from heap_resource import HeapPriorityResource
+from resource_usage import TrackedPriorityResource
+
+
+def grant_order(resource_type, seed=3, users=2000):
+    """
+    Order in which a resource grants requests with random priorities, some of them cancelled
+    """
+    env = simpy.Environment()
+    resource = resource_type(env, capacity=2)
+    rng = random.Random(seed)
+    granted = []
+
+    def user(number, priority, arrival, patience):
+        yield env.timeout(arrival)
+        with resource.request(priority=priority) as req:
+            result = yield req | env.timeout(patience)
+            if req in result:
+                granted.append((number, env.now))
+                yield env.timeout(rng.random())
+
+    for number in range(users):
+        env.process(user(number, rng.choice((-1, 0, 1)), rng.random() * 200, rng.random() * 20))
+    env.run()
+    return granted
+
+
+def test_heap_queue_grants_like_priority_resource():
+    assert grant_order(HeapPriorityResource) == grant_order(simpy.PriorityResource)
+
+
+def test_task_3v3_identical_with_priority_resource(monkeypatch):
+    with contextlib.redirect_stdout(io.StringIO()):
+        heap_results, heap_stats = Task_3v3.run_simulation(num_patients=2000, save=False)
+        monkeypatch.setattr(Task_3v3, "TrackedHeapPriorityResource", TrackedPriorityResource)
+        list_results, list_stats = Task_3v3.run_simulation(num_patients=2000, save=False)
+
+    for column in ("id", "type", "arrival", "departure"):
+        assert np.array_equal(heap_stats["patients"][column], list_stats["patients"][column])
+    assert heap_results["overall_avg_time"] == list_results["overall_avg_time"]
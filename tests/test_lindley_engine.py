@@ -0,0 +1,35 @@
+import io
+import math
+import statistics
+import contextlib
+import numpy as np
+import Task_1
+from lindley_engine import simulate_replications, station_order
+
+
+def test_lindley_engine_agrees_with_simpy():
+    lindley = simulate_replications(250, 200)
+    with contextlib.redirect_stdout(io.StringIO()):
+        simpy = [Task_1.run_simulation(replication=replication, save=False)[1] for replication in range(20)]
+
+    # Mean time overall and per patient type, |z| below 3 within the sampling noise
+    for group in ("overall", 1, 2, 3, 4):
+        means = []
+        for stats in (lindley, simpy):
+            times = [replication["times"] for replication in stats]
+            means.append([(time.overall if group == "overall" else time.types[group]).mean for time in times])
+        standard_error = math.hypot(*(statistics.stdev(values) / math.sqrt(len(values)) for values in means))
+        assert abs(statistics.mean(means[0]) - statistics.mean(means[1])) < 3 * standard_error, group
+
+
+def test_station_order_reuses_previous_order():
+    generator = np.random.default_rng(1)
+    arrivals = np.cumsum(generator.exponential(1.0, (50, 40)), axis=1)
+    arrivals[:, ::4] = np.inf
+    previous = station_order(arrivals)
+
+    # Moved arrivals and ties give the order of a stable sort from scratch
+    arrivals[:, 1:8] += generator.normal(0.0, 5.0, (50, 7))
+    arrivals[:, 9] = arrivals[:, 2]
+    order = station_order(arrivals, previous)
+    assert np.array_equal(order, np.argsort(arrivals, axis=1, kind="stable"))
@@ -0,0 +1,28 @@
+import numpy as np
+import Task_1
+import Task_3
+from raw_data_sink import load_raw_data
+
+
+def test_stream_with_default_arguments(tmp_path, monkeypatch):
+    # Defaults keep_patients=True and save=True, the results are written into tmp_path
+    monkeypatch.chdir(tmp_path)
+    results, stats = Task_3.run_simulation(num_patients=300, stream=str(tmp_path / "stream.npy"))
+
+    assert stats["stages"] is None
+    assert len(stats["patients"]) == 300
+    assert results["stream"]["patients"] == 300
+    assert len(load_raw_data(str(tmp_path / "stream.npy"))) == 300
+    assert (tmp_path / "results" / "Task3.csv").exists()
+    assert not (tmp_path / "raw_data").exists()
+
+
+def test_stream_matches_records(tmp_path):
+    # Same seed, same departures in the same order with and without the stream
+    results, stats = Task_1.run_simulation(num_patients=500, save=False)
+    streamed, _ = Task_1.run_simulation(num_patients=500, save=False, stream=str(tmp_path / "stream.npy"))
+
+    data = load_raw_data(str(tmp_path / "stream.npy"))
+    assert np.array_equal(data["Patient ID"], stats["patients"]["id"])
+    assert np.allclose(data["Total Time"], stats["patients"].total_time())
+    assert streamed["overall_avg_time"] == results["overall_avg_time"]
@@ -0,0 +1,32 @@
+import io
+import contextlib
+import Task_1
+from random_streams import STREAM_NAMES, ReplicationStreams, make_rng
+
+
+def run(**kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        results, stats = Task_1.run_simulation(num_patients=200, save=False, **kwargs)
+    return results, stats["patients"]["departure"].tolist()
+
+
+def test_make_rng_depends_on_seed_and_replication_only():
+    draws = [make_rng(10, 3).random() for _ in range(2)]
+    assert draws[0] == draws[1]
+    assert make_rng(10, 3).random() != make_rng(10, 4).random()
+    assert make_rng(10, 3).random() != make_rng(11, 3).random()
+
+
+def test_replication_streams_repeat_their_draws():
+    for kwargs in ({}, {"common_random_numbers": True}, {"pooled_variates": True}):
+        first, second = ReplicationStreams(10, 3, **kwargs), ReplicationStreams(10, 3, **kwargs)
+        for name in STREAM_NAMES:
+            assert [getattr(first, name).random() for _ in range(5)] == [getattr(second, name).random() for _ in range(5)]
+
+
+def test_same_seed_and_replication_give_identical_results():
+    # A replication run alone after others gives the same as run first
+    first = run(seed=10, replication=3)
+    run(seed=10, replication=0)
+    assert run(seed=10, replication=3) == first
+    assert run(seed=10, replication=4) != first
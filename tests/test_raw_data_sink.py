@@ -0,0 +1,30 @@
+import pytest
+from raw_data_sink import RawDataSink, NpySink, load_raw_data, read_header
+
+OLD_HEADER = ["Overall Average Time", "Standard Deviation"]
+NEW_HEADER = OLD_HEADER + ["Utilization Registration"]
+
+
+def test_csv_appends_to_file_with_same_columns(tmp_path):
+    filename = str(tmp_path / "results.csv")
+    for row in ([1.0, 2.0, 0.5], [3.0, 4.0, 0.25]):
+        with RawDataSink(filename) as sink:
+            sink.write_rows(NEW_HEADER, [row])
+    assert read_header(filename) == NEW_HEADER
+    with open(filename) as file:
+        assert len(file.readlines()) == 3
+
+
+@pytest.mark.parametrize("sink_class, name", [(RawDataSink, "results.csv"), (NpySink, "results.npy")])
+def test_file_with_other_columns_is_not_appended_to(tmp_path, sink_class, name):
+    filename = str(tmp_path / name)
+    with sink_class(filename) as sink:
+        sink.write_rows(OLD_HEADER, [[1.0, 2.0]])
+    with sink_class(filename) as sink:
+        with pytest.raises(ValueError):
+            sink.write_rows(NEW_HEADER, [[1.0, 2.0, 0.5]])
+    if name.endswith(".npy"):
+        assert list(load_raw_data(filename).dtype.names) == OLD_HEADER
+    else:
+        with open(filename) as file:
+            assert file.read().splitlines() == ["Overall Average Time;Standard Deviation", "1.0;2.0"]
@@ -0,0 +1,45 @@
+import io
+import statistics
+import contextlib
+import pytest
+import Task_1
+from replication_runner import run_replications, run_until_precision
+
+
+def test_process_pool_gives_the_serial_results():
+    with contextlib.redirect_stdout(io.StringIO()):
+        serial = run_replications(Task_1.run_simulation, replications=4, workers=1, num_patients=200)
+    pooled = run_replications(Task_1.run_simulation, replications=4, workers=2, num_patients=200)
+
+    # Same replication, same results, in the order of the replications
+    assert [results for results, stats in pooled] == [results for results, stats in serial]
+    assert ([stats["patients"]["departure"].tolist() for results, stats in pooled]
+            == [stats["patients"]["departure"].tolist() for results, stats in serial])
+
+
+def relative_half_width(values, z=statistics.NormalDist().inv_cdf(0.975)):
+    return z * statistics.stdev(values) / len(values) ** 0.5 / abs(statistics.mean(values))
+
+
+def test_run_until_precision_stops_at_the_target():
+    with contextlib.redirect_stdout(io.StringIO()):
+        replication_results, report = run_until_precision(Task_1.run_simulation, relative_half_width=0.02, batch_size=1,
+                                                          min_replications=2, workers=1, num_patients=200)
+    values = [results["overall_avg_time"] for results, stats in replication_results]
+
+    # Stopped with the first replication that met the target, and reports that number
+    assert len(values) > 2
+    assert report["overall_avg_time"]["replications"] == len(values)
+    assert relative_half_width(values) <= 0.02
+    assert all(relative_half_width(values[:count]) > 0.02 for count in range(2, len(values)))
+    assert report["overall_avg_time"]["relative_half_width"] == pytest.approx(relative_half_width(values))
+    assert report["overall_avg_time"]["mean"] == pytest.approx(statistics.mean(values))
+
+
+def test_run_until_precision_reports_a_missed_target():
+    with contextlib.redirect_stdout(io.StringIO()):
+        replication_results, report = run_until_precision(Task_1.run_simulation, relative_half_width=1e-6,
+                                                          min_replications=2, max_replications=4, workers=1,
+                                                          num_patients=200)
+    assert len(replication_results) == 4
+    assert report["overall_avg_time"]["replications"] is None
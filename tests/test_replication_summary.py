@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+from replication_summary import summarize, selected_replications
+
+
+def replications_table():
+    return pd.DataFrame({
+        "Overall Average Time": [150.2, 171.9, 140.4, 166.0, 158.3],
+        "Count Type 1": [88, 91, 79, 95, 84],
+        "Avg. Time Type 3": [210.5, np.nan, 198.1, 240.7, np.nan],
+        "Variant": ["a", "b", "a", "b", "a"],
+    })
+
+
+def test_summarize_matches_a_pandas_groupby():
+    df = replications_table()
+    summary = summarize(df)
+
+    # The same statistics per column from a groupby over the long table (skips NaN too)
+    long = df.drop(columns="Variant").melt(var_name="column").astype({"value": float})
+    long["row"] = long.groupby("column").cumcount()
+    expected = long.groupby("column", sort=False)["value"].agg(["mean", "std", "min", "max"])
+    positions = long.dropna().set_index("row").groupby("column", sort=False)["value"]
+    expected["argmin"], expected["argmax"] = positions.idxmin(), positions.idxmax()
+
+    assert list(summary.columns) == ["Overall Average Time", "Count Type 1", "Avg. Time Type 3"]
+    np.testing.assert_allclose(summary.T.to_numpy(), expected.to_numpy())
+
+
+def test_summary_leaves_the_table_unchanged():
+    df = replications_table()
+    original = df.copy()
+    summary = summarize(df)
+    selected = selected_replications(df, summary)
+    pd.testing.assert_frame_equal(df, original)
+
+    # Mean, a Max and Min row per column and the standard deviation
+    assert list(selected.index) == ["Mean", "Max Overall Average Time", "Min Overall Average Time", "Max Count Type 1",
+                                    "Min Count Type 1", "Max Avg. Time Type 3", "Min Avg. Time Type 3",
+                                    "Standard Deviation"]
+    assert selected.loc["Max Avg. Time Type 3", "Avg. Time Type 3"] == 240.7
+    assert selected.loc["Min Overall Average Time", "Count Type 1"] == 79
@@ -0,0 +1,40 @@
+import pytest
+import Task_1
+from arrival_process import DAY, NHPPArrivals, RateTable
+from result_cache import ResultCache, local_imports
+
+
+def arrivals():
+    return NHPPArrivals(RateTable([0, 360, 720, 1080], [1.0, 3.0, 5.0, 2.0], DAY))
+
+
+def test_key_of_arrivals_is_their_content(tmp_path):
+    cache = ResultCache(tmp_path)
+    key = cache.key(Task_1.run_simulation, num_patients=50, arrivals=arrivals())
+    assert key == cache.key(Task_1.run_simulation, num_patients=50, arrivals=arrivals())
+    other = NHPPArrivals(RateTable([0, 360, 720, 1080], [1.0, 3.0, 5.0, 2.5], DAY))
+    assert key != cache.key(Task_1.run_simulation, num_patients=50, arrivals=other)
+
+
+def test_arguments_without_stable_key_are_rejected(tmp_path):
+    cache = ResultCache(tmp_path)
+    with pytest.raises(ValueError):
+        cache.key(Task_1.run_simulation, arrivals=NHPPArrivals(lambda t: 1.0, max_rate=1.0))
+    with pytest.raises(TypeError):
+        cache.key(Task_1.run_simulation, arrivals=object())
+
+
+def test_runs_with_side_effects_are_not_cached(tmp_path):
+    cache = ResultCache(tmp_path)
+    with pytest.raises(ValueError):
+        cache.key(Task_1.run_simulation, profile=True)
+    cache.run(Task_1.run_simulation, num_patients=20, profile=True)
+    assert len(cache) == 0
+    cache.run(Task_1.run_simulation, num_patients=20)
+    assert len(cache) == 1
+
+
+def test_dependencies_are_the_imported_modules():
+    modules = local_imports("Task_1")
+    assert {"Task_1", "fast_engine", "random_streams", "arrival_process", "variate_pool"} <= set(modules)
+    assert "result_cache" not in modules
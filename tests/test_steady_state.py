@@ -0,0 +1,15 @@
+import pytest
+import Task_1
+from steady_state import run_steady_state
+
+
+def test_steady_state_run():
+    (results, stats), report = run_steady_state(Task_1.run_simulation, num_patients=5000, batches=5, seed=3)
+    assert len(stats["patients"]) == 5000
+    assert report["overall_avg_time"]["patients"] == 5000 - report["warmup"]["patients"]
+
+
+@pytest.mark.parametrize("argument", [{"keep_patients": False}, {"stream": "raw_data/steady.csv"}])
+def test_records_of_all_patients_are_required(argument):
+    with pytest.raises(ValueError):
+        run_steady_state(Task_1.run_simulation, num_patients=100, **argument)
@@ -0,0 +1,18 @@
+import pandas as pd
+from Task_2_Sweep import run_sweep
+
+
+def test_parallel_sweep_gives_the_serial_table(tmp_path):
+    kwargs = dict(cw_limits=(0, 2, 5), cw2_probabilities=(0.4, 0.6), replications=3, num_patients=200)
+    serial = run_sweep(workers=1, filename=None, **kwargs)
+    parallel = run_sweep(workers=2, filename=tmp_path / "sweep.csv", **kwargs)
+
+    # Same rows in the order of the grid, only the wall times differ
+    columns = [column for column in serial.columns if column != "Wall Time"]
+    pd.testing.assert_frame_equal(parallel[columns], serial[columns])
+    assert list(zip(serial["CW2 Limit"], serial["CW2 Probability"])) == [(0, 0.4), (0, 0.6), (2, 0.4), (2, 0.6),
+                                                                         (5, 0.4), (5, 0.6)]
+
+    # The written table is the returned one
+    written = pd.read_csv(tmp_path / "sweep.csv", sep=";")
+    pd.testing.assert_frame_equal(written[columns], parallel[columns], check_exact=False)
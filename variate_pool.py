@@ -0,0 +1,213 @@
+import numpy as np
+from functools import partial
+from itertools import chain
+
+"""
+    Pre-sampled random variates for the simulation.
+
+    Every call of random.triangular or random.expovariate is a separate Python level call in
+    the hot loop of the simulation. PooledRandom draws the variates of every distribution
+    (registration, CW1, CW2, X-ray, plaster, interarrival, ...) in large vectorized NumPy blocks
+    and hands them out one by one, a new block is only drawn when the old one is used up.
+
+    PooledRandom has the same methods as random.Random that the simulation uses (triangular,
+    expovariate, random, choices) with the same meaning of the arguments, so it can be used as
+    a random number stream wherever a random.Random is expected. A call of these methods still
+    looks up the distribution, so the models fetch the draw function of every distribution and
+    parameter set once with bound_variates: the bound __next__ of the endless iterator over its
+    blocks, a single C level call per variate. Methods and draw functions share the iterators,
+    so they give the same variates.
+"""
+
+# Number of variates drawn at once for each distribution
+BLOCK_SIZE = 4096
+
+
+class PooledRandom:
+    """
+    Random number stream that hands out variates from pre-sampled blocks.
+    There is one endless iterator over the blocks per distribution (and parameters), the next
+    block is drawn lazily when the current one is used up.
+    """
+
+    def __init__(self, seed_sequence, block_size=BLOCK_SIZE):
+        """
+        Parameters:
+            seed_sequence (SeedSequence): seed of the NumPy generator of this stream
+            block_size (int): Number of variates drawn at once for each distribution
+        """
+        self.generator = np.random.default_rng(seed_sequence)
+        self.block_size = block_size
+
+        # Bound __next__ of the iterator over the blocks per distribution and parameters
+        self.uniform_draws = self._draws(self.generator.random)
+        self.exponential_draws = {}
+        self.triangular_draws = {}
+        self.choice_draws = {}
+
+    def _draws(self, sample):
+        """
+        Draw function of a distribution
+
+        Parameters:
+            sample (function): draws a block as function of the size
+
+        Returns:
+            function: bound __next__ of the endless iterator over the blocks
+        """
+        blocks = iter(lambda: sample(self.block_size).tolist(), None)
+        return chain.from_iterable(blocks).__next__
+
+    def variates(self, distribution, *parameters):
+        """
+        Draw function of one distribution and parameter set, with the same arguments as the
+        method of the distribution. Fetched once, e.g. per resource and stage of a model.
+
+        Parameters:
+            distribution (str): "random", "expovariate", "triangular" or "choice" (choices
+                with k=1, the chosen value instead of a list)
+            *parameters: arguments of the distribution, positional
+
+        Returns:
+            function: draws the next variate, without arguments
+        """
+        if distribution == "random":
+            return self.uniform_draws
+        if distribution == "expovariate":
+            return self._exponential(*parameters)
+        if distribution == "triangular":
+            return self._triangular(*parameters)
+        if distribution == "choice":
+            return self._choice_values(*parameters)
+        raise ValueError(f"Unknown distribution {distribution}")
+
+    def _exponential(self, lambd=1.0):
+        try:
+            return self.exponential_draws[lambd]
+        except KeyError:
+            draws = self.exponential_draws[lambd] = self._draws(partial(self.generator.exponential, 1 / lambd))
+            return draws
+
+    def _triangular(self, low=0.0, high=1.0, mode=None):
+        # Nested dicts instead of a tuple key, hashing a tuple of floats costs more than the draw
+        try:
+            return self.triangular_draws[low][high][mode]
+        except KeyError:
+            draws = self._draws(partial(sample_triangular, self.generator, low=low, high=high, mode=mode))
+            self.triangular_draws.setdefault(low, {}).setdefault(high, {})[mode] = draws
+            return draws
+
+    def _choice(self, count, weights=None):
+        key = (count, None if weights is None else tuple(weights))
+        try:
+            return self.choice_draws[key]
+        except KeyError:
+            cum_weights = np.cumsum([1] * count if weights is None else weights, dtype=float)
+            draws = self.choice_draws[key] = self._draws(
+                lambda size: np.searchsorted(cum_weights, self.generator.random(size) * cum_weights[-1], side="right"))
+            return draws
+
+    def _choice_values(self, population, weights=None):
+        # The chosen values of the indices, the indices are shared with choices
+        return map(population.__getitem__, iter(self._choice(len(population), weights), None)).__next__
+
+    def random(self):
+        """
+        Returns:
+            float: uniform random value in [0, 1)
+        """
+        return self.uniform_draws()
+
+    def expovariate(self, lambd=1.0):
+        """
+        Parameters:
+            lambd (float): rate of the exponential distribution
+
+        Returns:
+            float: exponentially distributed random value
+        """
+        try:
+            return self.exponential_draws[lambd]()
+        except KeyError:
+            return self._exponential(lambd)()
+
+    def triangular(self, low=0.0, high=1.0, mode=None):
+        """
+        Same arguments and inversion formula as random.triangular
+
+        Parameters:
+            low (float): first bound of the distribution
+            high (float): second bound of the distribution
+            mode (float, optional): mode of the distribution, midpoint if not given
+
+        Returns:
+            float: triangular distributed random value
+        """
+        try:
+            return self.triangular_draws[low][high][mode]()
+        except KeyError:
+            return self._triangular(low, high, mode)()
+
+    def choices(self, population, weights=None, k=1):
+        """
+        Same meaning of the arguments as random.choices (without cum_weights)
+
+        Parameters:
+            population (list): values to choose from
+            weights (list, optional): relative weights of the values, equal if not given
+            k (int): Number of chosen values
+
+        Returns:
+            list: k chosen values
+        """
+        draw = self._choice(len(population), weights)
+        return [population[draw()] for _ in range(k)]
+
+
+def bound_variates(stream, distribution, *parameters):
+    """
+    Draw function of one distribution and parameter set of a random number stream, fetched
+    once (e.g. per resource and stage) instead of calling the stream for every variate
+
+    Parameters:
+        stream (random.Random or PooledRandom): random number stream to draw from
+        distribution (str): "random", "expovariate", "triangular" or "choice" (choices with
+            k=1, the chosen value instead of a list)
+        *parameters: arguments of the distribution, positional as for the method of the stream
+
+    Returns:
+        function: draws the next variate, without arguments. The draws are the same as those
+            of the methods of the stream
+    """
+    if isinstance(stream, PooledRandom):
+        return stream.variates(distribution, *parameters)
+    if distribution == "choice":
+        choices = partial(stream.choices, *parameters)
+        return lambda: choices()[0]
+    return partial(getattr(stream, distribution), *parameters)
+
+
+def sample_triangular(generator, size, low, high, mode):
+    """
+    Draws triangular distributed values, vectorized version of random.triangular
+
+    Parameters:
+        generator (Generator): NumPy generator to draw from
+        size (int or tuple): Number or shape of the values
+        low (float): first bound of the distribution
+        high (float): second bound of the distribution
+        mode (float, optional): mode of the distribution, midpoint if not given
+
+    Returns:
+        ndarray: triangular distributed values
+    """
+    u = generator.random(size)
+    if high == low:
+        return np.full(size, float(low))
+    c = 0.5 if mode is None else (mode - low) / (high - low)
+    values = low + (high - low) * np.sqrt(u * c)
+    # Upper part of the distribution, random.triangular mirrors u and c here
+    upper = u > c
+    if upper.any():
+        values[upper] = high + (low - high) * np.sqrt((1.0 - u[upper]) * (1.0 - c))
+    return values